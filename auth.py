@@ -1,12 +1,15 @@
+import time
 import streamlit as st
-import psycopg2
-import bcrypt
-from db import get_db_connection
-from db import get_main_db_connection
+from db import main_db_connection
+from passwords import (
+    hash_password, login_retry_after, needs_rehash, record_login_failure,
+    record_login_latency, reset_login_failures, verify_password,
+)
+from session_tokens import clear_session, persist_session, restore_session
 
 # Role-based access control
 ROLE_ACCESS = {
-    "admin": ["shift_output_form", "reports_dashboard", "master_data", "user_management", "extract_data", "change_password"],
+    "admin": ["shift_output_form", "reports_dashboard", "master_data", "user_management", "extract_data", "change_password", "bulk_import", "cross_branch", "diagnostics"],
     "user": ["shift_output_form", "reports_dashboard", "extract_data", "change_password"],
     "power user": ["shift_output_form", "reports_dashboard", "master_data", "extract_data", "change_password"],
     "report": ["reports_dashboard", "extract_data", "change_password"],
@@ -14,20 +17,35 @@ ROLE_ACCESS = {
 
 def check_authentication():
     if "authenticated" not in st.session_state or not st.session_state["authenticated"]:
-        st.warning("You must log in to access this page.")
-        st.stop()  # Stops execution if the user is not authenticated
+        # ✅ After a reload, the signed URL token restores the login without a DB query or bcrypt
+        if not restore_session():
+            st.warning("You must log in to access this page.")
+            st.stop()  # Stops execution if the user is not authenticated
+    persist_session()
 
 def check_access(required_roles):
     if "role" not in st.session_state or st.session_state["role"] not in required_roles:
         st.error("Access Denied: You do not have permission to view this page.")
         st.stop()        
 
+def rehash_password(username, password):
+    """Upgrades a stored hash to the configured bcrypt work factor after a successful login."""
+    try:
+        new_hash = hash_password(password)
+        with main_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("UPDATE users SET password = %s WHERE username = %s", (new_hash, username))
+    except Exception as e:
+        print(f"❌ Failed to rehash password for {username}: {e}")  # Login still succeeds
+
 def authenticate_user():
     """Handles user authentication and assigns branch based on database records."""
     
-    # Prevent duplicate authentication checks
-    if st.session_state.get("authenticated", False):
+    # Prevent duplicate authentication checks (a valid session token counts as logged in)
+    if st.session_state.get("authenticated", False) or restore_session():
         st.sidebar.success(f"Logged in as {st.session_state['username']} ({st.session_state['role']})")
+        if st.sidebar.button("Log out", key="logout_button"):
+            clear_session(revoke=True)
+            st.rerun()
         return {
             "username": st.session_state["username"],
             "role": st.session_state["role"],
@@ -40,36 +58,54 @@ def authenticate_user():
     password = st.sidebar.text_input("Password", type="password", key="login_password")
 
     if st.sidebar.button("Login", key="login_button"):
-        conn = get_main_db_connection()
-        cur = conn.cursor()
+        # ✅ Repeated failures for a username are refused before any DB or bcrypt work
+        retry_after = login_retry_after(username)
+        if retry_after:
+            st.sidebar.error(f"Too many failed attempts. Try again in {retry_after} seconds.")
+            return None
 
+        started = time.perf_counter()
         try:
-            # Fetch user details
-            cur.execute("SELECT username, password, role, branch FROM users WHERE username = %s", (username,))
-            user = cur.fetchone()
-
-            if user:
-                stored_password = user[1].strip()  # Ensure no extra spaces
-                if bcrypt.checkpw(password.encode(), stored_password.encode()):
-                    # Store login info in session state
-                    st.session_state["authenticated"] = True
-                    st.session_state["username"] = user[0]
-                    st.session_state["role"] = user[2]
-                    st.session_state["branch"] = user[3]  # Assign branch from the users table
-                    st.sidebar.success(f"Logged in as {user[0]} ({user[2]})")
-                    st.rerun()
-                else:
-                    st.sidebar.error("Invalid username or password")
-
-            else:
-                st.sidebar.error("User not found")
-
+            # Fetch user details from the pooled auth connection
+            with main_db_connection() as conn, conn.cursor() as cur:
+                cur.execute("SELECT username, password, role, branch FROM users WHERE username = %s", (username,))
+                user = cur.fetchone()
         except Exception as e:
+            record_login_latency(time.perf_counter() - started)
             st.sidebar.error("Database error. Please try again.")
             st.write(f"DEBUG: Auth error → {e}")
+            return None
+
+        if user:
+            stored_password = user[1].strip()  # Ensure no extra spaces
+            try:
+                password_ok = verify_password(password, stored_password)  # ✅ Runs in the bcrypt process pool
+            except Exception as e:  # Queue wait over hash_timeout or a broken worker pool
+                record_login_latency(time.perf_counter() - started)
+                print(f"❌ Password check failed for {username}: {e!r}")
+                st.sidebar.error("Login is busy. Please try again.")
+                return None
+            if password_ok:
+                reset_login_failures(username)
+                if needs_rehash(stored_password):
+                    rehash_password(user[0], password)
+                record_login_latency(time.perf_counter() - started)
+
+                # Store login info in session state
+                st.session_state["authenticated"] = True
+                st.session_state["username"] = user[0]
+                st.session_state["role"] = user[2]
+                st.session_state["branch"] = user[3]  # Assign branch from the users table
+                st.sidebar.success(f"Logged in as {user[0]} ({user[2]})")
+                st.rerun()
+            else:
+                record_login_failure(username)
+                record_login_latency(time.perf_counter() - started)
+                st.sidebar.error("Invalid username or password")
 
-        finally:
-            cur.close()
-            conn.close()
+        else:
+            record_login_failure(username)
+            record_login_latency(time.perf_counter() - started)
+            st.sidebar.error("User not found")
 
     return None  # Authentication failed
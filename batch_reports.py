@@ -0,0 +1,207 @@
+import argparse
+import datetime
+import io
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+from db import fetch_branches
+from dashboard_data import get_dashboard_frames
+from report_render import create_pdf, iter_report_html
+
+SHIFTS = ["Day", "Night", "Plan"]
+REPORT_FORMATS = ["pdf", "html", "xlsx"]
+DEFAULT_OUTPUT_DIR = "reports"
+
+# ✅ When each shift closes (local time); the Night shift closes the morning after its date.
+# Override with [reports] shift_close = { Day = "19:30", ... } in st.secrets.
+SHIFT_CLOSE_DEFAULTS = {"Day": "19:30", "Night": "07:30", "Plan": "19:30"}
+NIGHT_SHIFT = "Night"
+
+
+class LocalDirectorySink:
+    """Writes reports under ``root`` using object-store style keys (branch/date/shift.ext)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def put(self, key, data):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # ✅ Readers never see half-written files
+        return path
+
+
+def build_figure(df_av):
+    if df_av.empty:
+        return None
+    return px.bar(df_av, x="machine", y=["Availability", "Av Efficiency", "OEE"],
+                  barmode="group", title="Performance Metrics per Machine",
+                  color_discrete_map={"Availability": "#1f77b4", "Av Efficiency": "#ff7f0e", "OEE": "#2ca02c"})
+
+
+def build_excel(df_av, df_archive, df_production):
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        df_archive.to_excel(writer, sheet_name="activity", index=False)
+        df_production.to_excel(writer, sheet_name="production", index=False)
+        df_av.to_excel(writer, sheet_name="av", index=False)
+    return output.getvalue()
+
+
+def machine_frames(frames, machine):
+    """Filters shift DataFrames (av, archive, production) down to one machine."""
+    df_av, df_archive, df_production = frames
+    return (
+        df_av[df_av["machine"] == machine].reset_index(drop=True),
+        df_archive[df_archive["Machine"] == machine].reset_index(drop=True),
+        df_production[df_production["Machine"] == machine].reset_index(drop=True),
+    )
+
+
+def _render_formats(sink, prefix, frames, formats):
+    df_av, df_archive, df_production = frames
+    fig = build_figure(df_av)
+    renderers = {
+        "pdf": lambda: create_pdf(df_av, df_archive, df_production, fig),
+        "html": lambda: "".join(iter_report_html(df_av, df_archive, df_production, fig)).encode("utf-8"),
+        "xlsx": lambda: build_excel(df_av, df_archive, df_production),
+    }
+    results = []
+    for fmt in formats:
+        start = time.perf_counter()
+        try:
+            path = sink.put(f"{prefix}.{fmt}", renderers[fmt]())
+            results.append((prefix, fmt, path, time.perf_counter() - start, None))
+        except Exception:
+            results.append((prefix, fmt, None, time.perf_counter() - start, traceback.format_exc(limit=3)))
+    return results
+
+
+def generate_shift_reports(branch, date, shift, output_dir, formats=REPORT_FORMATS, per_machine=True):
+    """Renders every format for one (branch, date, shift); runs inside a worker process.
+
+    The shift report covers all machines; ``per_machine`` (the default) also writes one
+    report per machine under ``branch/date/shift/``. The day's rows are fetched once either way.
+    Returns a list of (report key, format, path or None, seconds, error or None).
+    """
+    sink = LocalDirectorySink(output_dir)
+    prefix = f"{branch}/{date}/{shift}"
+    try:
+        frames = get_dashboard_frames(date, shift, branch)
+    except Exception:
+        return [(prefix, fmt, None, 0.0, traceback.format_exc(limit=3)) for fmt in formats]
+
+    results = _render_formats(sink, prefix, frames, formats)
+    if per_machine:
+        machines = sorted(set(frames.av["machine"]) | set(frames.archive["Machine"]))
+        for machine in machines:
+            results += _render_formats(sink, f"{prefix}/{machine}", machine_frames(frames, machine), formats)
+    return results
+
+
+def run_batch(date, shifts=SHIFTS, branches=None, output_dir=DEFAULT_OUTPUT_DIR, workers=None,
+              formats=REPORT_FORMATS, per_machine=True):
+    """Generates reports for every branch × shift of a date across a process pool.
+
+    Logs runtime and failures per report; returns the number of failed reports
+    (an unreadable branch catalogue counts as one failure and renders nothing).
+    """
+    if not branches:
+        # ✅ No silent fallback to "main": a scheduler run must not skip branches unnoticed
+        try:
+            branches = fetch_branches()
+        except Exception as e:
+            print(f"❌ {date}: could not read public.branches, no reports rendered: {e}")
+            return 1
+    failures = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(generate_shift_reports, branch, date, shift, output_dir, formats, per_machine): (branch, shift)
+            for branch in branches
+            for shift in shifts
+        }
+        for future in as_completed(futures):
+            branch, shift = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                # ✅ A crashed worker only fails its own reports
+                results = [(f"{branch}/{date}/{shift}", fmt, None, 0.0, repr(e)) for fmt in formats]
+            for report, fmt, path, seconds, error in results:
+                if error:
+                    failures += 1
+                    print(f"❌ {report}.{fmt} failed after {seconds:.1f}s: {error}")
+                else:
+                    print(f"✅ {report}.{fmt} → {path} ({seconds:.1f}s)")
+    return failures
+
+
+def get_shift_close_times():
+    configured = st.secrets.get("reports", {}).get("shift_close", {})
+    closes = {}
+    for shift, default in SHIFT_CLOSE_DEFAULTS.items():
+        closes[shift] = datetime.datetime.strptime(configured.get(shift, default), "%H:%M").time()
+    return closes
+
+
+def closed_shifts_between(since, now, close_times):
+    """Returns (date, shift) pairs whose close time falls in (since, now]."""
+    due = []
+    day = since.date() - datetime.timedelta(days=1)
+    while day <= now.date():
+        for shift, close in close_times.items():
+            report_date = day - datetime.timedelta(days=1) if shift == NIGHT_SHIFT else day
+            closed_at = datetime.datetime.combine(day, close)
+            if since < closed_at <= now:
+                due.append((report_date, shift))
+        day += datetime.timedelta(days=1)
+    return due
+
+
+def watch(output_dir=DEFAULT_OUTPUT_DIR, workers=None, per_machine=True, poll_seconds=60):
+    """Scheduler loop: renders each shift's reports for all branches once the shift closes."""
+    close_times = get_shift_close_times()
+    since = datetime.datetime.now()
+    print(f"⏰ Watching shift close times {', '.join(f'{s} {t:%H:%M}' for s, t in close_times.items())}")
+    while True:
+        time.sleep(poll_seconds)
+        now = datetime.datetime.now()
+        for report_date, shift in closed_shifts_between(since, now, close_times):
+            started = time.perf_counter()
+            failed = run_batch(report_date, [shift], output_dir=output_dir, workers=workers, per_machine=per_machine)
+            print(f"⏱️ {report_date} {shift}: batch finished in {time.perf_counter() - started:.1f}s ({failed} failed)")
+        since = now
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate PDF/HTML/Excel shift reports for all branches.")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, help="report date (default: yesterday)")
+    parser.add_argument("--shift", choices=SHIFTS, action="append", help="shift(s) to render (default: all)")
+    parser.add_argument("--branch", action="append", help="branch(es) to render (default: public.branches)")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--format", choices=REPORT_FORMATS, action="append", help="format(s) to render (default: all)")
+    parser.add_argument("--no-per-machine", dest="per_machine", action="store_false",
+                        help="only write the all-machines shift report, not one per machine")
+    parser.add_argument("--watch", action="store_true", help="keep running and render each shift when it closes")
+    args = parser.parse_args(argv)
+
+    if args.watch:
+        watch(args.output_dir, args.workers, args.per_machine)
+        return 0
+
+    date = args.date or datetime.date.today() - datetime.timedelta(days=1)
+    failed = run_batch(date, args.shift or SHIFTS, args.branch, args.output_dir, args.workers,
+                       args.format or REPORT_FORMATS, args.per_machine)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
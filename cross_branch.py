@@ -0,0 +1,95 @@
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+import pandas as pd
+import streamlit as st
+from dashboard_data import get_dashboard_frames, get_trend
+
+# ✅ Branch queries are I/O bound, so threads overlap their round trips. The pool is
+# module-level so a hung branch never blocks the page past its timeout.
+# A running call cannot be cancelled, so a call that misses its deadline is remembered:
+# until it finishes (connect_timeout/keepalives in db.py bound that), its branch is
+# reported as unavailable instead of piling another stuck worker up on every page view.
+BRANCH_WORKERS = 8  # one extra worker per configured branch is always added on top
+BRANCH_TIMEOUT = 15  # seconds per fan-out
+
+_executor = None
+_stuck = {}  # branch -> Future that missed its fan-out deadline and is still running
+_lock = threading.Lock()
+
+FanOutResult = namedtuple("FanOutResult", ["results", "errors"])
+
+
+def get_branch_hosts():
+    """Returns every branch with a database host configured in st.secrets."""
+    return list(st.secrets["database"]["hosts"])
+
+
+def fan_out(func, branches=None, timeout=BRANCH_TIMEOUT):
+    """Runs ``func(branch)`` for every branch concurrently.
+
+    Returns FanOutResult(results {branch: value}, errors {branch: message});
+    branches that fail or miss the timeout land in ``errors``.
+    """
+    global _executor
+    branches = branches or get_branch_hosts()
+    results, errors = {}, {}
+    futures = {}
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=BRANCH_WORKERS + len(get_branch_hosts()), thread_name_prefix="cross-branch"
+            )
+        for branch in branches:
+            stuck = _stuck.get(branch)
+            if stuck is not None and not stuck.done():
+                errors[branch] = "not responding (an earlier request is still waiting on it)"
+                continue
+            _stuck.pop(branch, None)
+            futures[_executor.submit(func, branch)] = branch
+    done, not_done = wait(futures, timeout=timeout)
+
+    for future in done:
+        branch = futures[future]
+        try:
+            results[branch] = future.result()
+        except Exception as e:
+            errors[branch] = str(e)
+    with _lock:
+        for future in not_done:
+            _stuck[futures[future]] = future
+            errors[futures[future]] = f"timed out after {timeout}s"
+    return FanOutResult(results, errors)
+
+
+def _with_branch(frames_by_branch):
+    frames = [df.assign(branch=branch) for branch, df in frames_by_branch.items() if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    return df[["branch"] + [c for c in df.columns if c != "branch"]]
+
+
+def get_plant_av(date, shift, branches=None, timeout=BRANCH_TIMEOUT):
+    """Returns (per-machine av rows of every branch with a branch column, errors) for a date/shift."""
+    fetched = fan_out(lambda branch: get_dashboard_frames(date, shift, branch).av, branches, timeout)
+    return _with_branch(fetched.results), fetched.errors
+
+
+def get_plant_trend(start, end, grain="day", shift=None, branches=None, timeout=BRANCH_TIMEOUT):
+    """Returns (get_trend() rows of every branch with a branch column, errors)."""
+    fetched = fan_out(lambda branch: get_trend(start, end, grain, shift, branch=branch), branches, timeout)
+    return _with_branch(fetched.results), fetched.errors
+
+
+def plant_summary(plant_av):
+    """Averages Availability, Av Efficiency and OEE per branch plus a plant-wide row."""
+    metrics = ["Availability", "Av Efficiency", "OEE"]
+    if plant_av.empty:
+        return pd.DataFrame(columns=["branch", "machines"] + metrics)
+    per_branch = plant_av.groupby("branch", as_index=False).agg(
+        machines=("machine", "nunique"), **{m: (m, "mean") for m in metrics}
+    )
+    plant = pd.DataFrame([{"branch": "Plant-wide", "machines": per_branch["machines"].sum(),
+                           **{m: plant_av[m].mean() for m in metrics}}])
+    return pd.concat([per_branch, plant], ignore_index=True)
@@ -0,0 +1,113 @@
+import argparse
+import time
+from db import get_sqlalchemy_engine
+
+# ✅ Pre-aggregated archive per (date, shift, machine, activity); maintained on every save
+# so dashboard reads no longer scale with archive history.
+CREATE_SUMMARY_SQL = """
+    CREATE TABLE IF NOT EXISTS daily_machine_summary (
+        "date" date NOT NULL,
+        "shift" text NOT NULL,
+        "machine" text NOT NULL,
+        "activity" text NOT NULL,
+        total_time double precision,
+        efficiency_sum double precision,
+        efficiency_count integer NOT NULL DEFAULT 0,
+        produced_quantity double precision,
+        row_count integer NOT NULL DEFAULT 0,
+        PRIMARY KEY ("date", "shift", "machine", "activity")
+    )
+"""
+
+_SUMMARY_COLUMNS = """
+    "date", "shift", "machine", "activity",
+    total_time, efficiency_sum, efficiency_count, produced_quantity, row_count
+"""
+
+_SUMMARY_SELECT = """
+    SELECT a."Date", COALESCE(a."Day/Night/plan", ''), COALESCE(a."Machine", ''), COALESCE(a."Activity", ''),
+           SUM(a."time"), SUM(a."efficiency"), COUNT(a."efficiency"), SUM(a."quantity"), COUNT(*)
+    FROM archive a
+"""
+
+_SUMMARY_GROUP = "GROUP BY 1, 2, 3, 4"
+
+# Recomputes the summary rows of a batch of (date, shift, machine) keys; two statements, one round trip
+REFRESH_KEYS_SQL = f"""
+    DELETE FROM daily_machine_summary s
+    USING unnest(%(dates)s::date[], %(shifts)s::text[], %(machines)s::text[]) AS k("date", "shift", "machine")
+    WHERE s."date" = k."date" AND s."shift" = k."shift" AND s."machine" = k."machine";
+
+    INSERT INTO daily_machine_summary ({_SUMMARY_COLUMNS})
+    {_SUMMARY_SELECT}
+    JOIN unnest(%(dates)s::date[], %(shifts)s::text[], %(machines)s::text[]) AS k("date", "shift", "machine")
+      ON a."Date" = k."date" AND a."Day/Night/plan" = k."shift" AND a."Machine" = k."machine"
+    {_SUMMARY_GROUP};
+"""
+
+# Full rebuild for backfills, optionally limited to a date range
+REBUILD_SQL = f"""
+    DELETE FROM daily_machine_summary
+    WHERE "date" BETWEEN %(start)s AND %(end)s;
+
+    INSERT INTO daily_machine_summary ({_SUMMARY_COLUMNS})
+    {_SUMMARY_SELECT}
+    WHERE a."Date" BETWEEN %(start)s AND %(end)s
+    {_SUMMARY_GROUP};
+"""
+
+# Used by the migration that introduces the table
+BACKFILL_SQL = f"""
+    INSERT INTO daily_machine_summary ({_SUMMARY_COLUMNS})
+    {_SUMMARY_SELECT}
+    WHERE a."Date" IS NOT NULL
+    {_SUMMARY_GROUP}
+    ON CONFLICT DO NOTHING
+"""
+
+
+def refresh_daily_summary(cur, keys):
+    """Recomputes summary rows for shift keys (objects with date/shift/machine) on an open cursor.
+
+    Call it in the same transaction as the archive write so the rollup never drifts.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    cur.execute(REFRESH_KEYS_SQL, {
+        "dates": [k.date for k in keys],
+        "shifts": [k.shift for k in keys],
+        "machines": [k.machine for k in keys],
+    })
+
+
+def rebuild_daily_summary(branch, start="-infinity", end="infinity"):
+    """Rebuilds the rollup for a date range from archive; returns the elapsed seconds."""
+    started = time.perf_counter()
+    conn = get_sqlalchemy_engine(branch).raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(REBUILD_SQL, {"start": start, "end": end})
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild daily_machine_summary from archive.")
+    parser.add_argument("--branch", default="main")
+    parser.add_argument("--start", default="-infinity", help="first date (YYYY-MM-DD)")
+    parser.add_argument("--end", default="infinity", help="last date (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    seconds = rebuild_daily_summary(args.branch, args.start, args.end)
+    print(f"✅ {args.branch}: daily_machine_summary rebuilt for {args.start} → {args.end} in {seconds:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+import pandas as pd
+from sqlalchemy.sql import text
+import streamlit as st
+from db import get_sqlalchemy_engine
+
+# ✅ Short TTL as a safety net; saves invalidate the affected date explicitly
+DASHBOARD_TTL = 120  # seconds
+DASHBOARD_CACHE_SIZE = 256  # entries per cache; expired entries are dropped on every write
+
+# ✅ One round trip per date, tagged by section: av rows, daily_machine_summary rollup rows
+# and the Production archive rows (for the per-batch table), for every shift.
+# Shift filtering happens in memory, so switching shifts never re-queries.
+DASHBOARD_SQL = """
+    SELECT 'av' AS section, "machine" AS machine, "shift" AS shift,
+           NULL::text AS activity, NULL::double precision AS total_time,
+           NULL::double precision AS efficiency_sum, NULL::integer AS efficiency_count,
+           NULL::text AS batch, NULL::text AS product, NULL::double precision AS quantity,
+           "Availability" AS availability, "Av Efficiency" AS av_efficiency, "OEE" AS oee
+    FROM av
+    WHERE "date" = :date
+    UNION ALL
+    SELECT 'summary', "machine", "shift",
+           "activity", total_time,
+           efficiency_sum, efficiency_count,
+           NULL, NULL, produced_quantity,
+           NULL, NULL, NULL
+    FROM daily_machine_summary
+    WHERE "date" = :date
+    UNION ALL
+    SELECT 'production', "Machine", "Day/Night/plan",
+           "Activity", NULL,
+           NULL, NULL,
+           "batch number", "Product", "quantity",
+           NULL, NULL, NULL
+    FROM archive
+    WHERE "Date" = :date AND "Activity" = 'Production'
+"""
+
+# ✅ Trend rollups are computed in SQL; only one row per (period, machine) reaches pandas.
+# The worst-N machines (lowest OEE over the whole range) are picked in the same query.
+TREND_SQL = """
+    WITH filtered AS (
+        SELECT "date", "machine", "Availability", "Av Efficiency", "OEE"
+        FROM av
+        WHERE "date" BETWEEN :start AND :end
+          AND (CAST(:shift AS text) IS NULL OR "shift" = :shift)
+    ),
+    ranked AS (
+        SELECT "machine", AVG("OEE") AS range_oee
+        FROM filtered
+        GROUP BY "machine"
+        ORDER BY range_oee ASC NULLS LAST
+        LIMIT :top_n
+    )
+    SELECT date_trunc(:grain, f."date")::date AS period,
+           f."machine" AS machine,
+           AVG(f."Availability") AS "Availability",
+           AVG(f."Av Efficiency") AS "Av Efficiency",
+           AVG(f."OEE") AS "OEE",
+           COUNT(*) AS shifts,
+           MAX(r.range_oee) AS range_oee
+    FROM filtered f
+    JOIN ranked r ON r."machine" = f."machine"
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+"""
+
+TREND_GRAINS = {"Daily": "day", "Weekly": "week", "Monthly": "month"}
+
+DashboardFrames = namedtuple("DashboardFrames", ["av", "archive", "production"])
+
+_rows_cache = OrderedDict()  # oldest write first
+_trend_cache = OrderedDict()
+_rows_cache_lock = threading.Lock()
+
+
+def _resolve_branch(branch):
+    return branch if branch is not None else st.session_state.get("branch", "main")
+
+
+def _fetch_day(branch, date):
+    engine = get_sqlalchemy_engine(branch)
+    with engine.connect() as conn:
+        return pd.read_sql(text(DASHBOARD_SQL), conn, params={"date": date})
+
+
+def _cache_put(cache, key, value):
+    """Stores a value and evicts expired entries and the oldest ones beyond DASHBOARD_CACHE_SIZE."""
+    now = time.time()
+    with _rows_cache_lock:
+        cache[key] = (now, value)
+        cache.move_to_end(key)
+        while len(cache) > DASHBOARD_CACHE_SIZE or now - next(iter(cache.values()))[0] >= DASHBOARD_TTL:
+            cache.popitem(last=False)  # the entry just written is never expired, so this stops on it
+
+
+def get_day_rows(date, branch=None):
+    """Returns the raw av/archive rows for a date, cached per (branch, date)."""
+    key = (_resolve_branch(branch), date)
+    cached = _rows_cache.get(key)
+    if cached is not None and time.time() - cached[0] < DASHBOARD_TTL:
+        return cached[1]
+
+    rows = _fetch_day(key[0], date)
+    _cache_put(_rows_cache, key, rows)
+    return rows
+
+
+def invalidate_dashboard(date=None, branch=None):
+    """Drops cached dashboard rows for one date of a branch (or the whole branch) and its trends."""
+    branch = _resolve_branch(branch)
+    with _rows_cache_lock:
+        for key in [k for k in _rows_cache if k[0] == branch and (date is None or k[1] == date)]:
+            del _rows_cache[key]
+        for key in [k for k in _trend_cache if k[0] == branch and (date is None or k[1] <= date <= k[2])]:
+            del _trend_cache[key]
+
+
+def build_dashboard_frames(rows, shift):
+    """Derives the av, activity summary and production summary tables for one shift."""
+    av_rows = rows[(rows["section"] == "av") & (rows["shift"] == shift)]
+    df_av = av_rows[["machine", "availability", "av_efficiency", "oee"]].rename(columns={
+        "availability": "Availability", "av_efficiency": "Av Efficiency", "oee": "OEE",
+    }).reset_index(drop=True)
+
+    summary_rows = rows[rows["section"] == "summary"]
+    shift_summary = summary_rows[summary_rows["shift"] == shift]
+    df_archive = pd.DataFrame({
+        "Machine": shift_summary["machine"],
+        "Activity": shift_summary["activity"],
+        "Total_Time": shift_summary["total_time"],
+        "Avg_Efficiency": shift_summary["efficiency_sum"] / shift_summary["efficiency_count"].where(shift_summary["efficiency_count"] > 0),
+    }).reset_index(drop=True)
+
+    # Total Batch Output is the machine's production over the whole date (all shifts)
+    total_output = summary_rows[summary_rows["activity"] == "Production"].groupby("machine")["quantity"].sum()
+
+    production_rows = rows[(rows["section"] == "production") & (rows["shift"] == shift)]
+    df_production = (
+        production_rows.groupby(["machine", "batch", "product"], as_index=False, dropna=False)
+        .agg(**{"Produced Quantity": ("quantity", "sum")})
+        .sort_values(["machine", "batch"])
+        .rename(columns={"machine": "Machine", "batch": "batch number", "product": "Product"})
+        .reset_index(drop=True)
+    )
+    df_production["Total Batch Output"] = df_production["Machine"].map(total_output)
+
+    return DashboardFrames(df_av, df_archive, df_production)
+
+
+def get_dashboard_frames(date, shift, branch=None):
+    """Returns DashboardFrames(av, archive, production) for a (branch, date, shift)."""
+    return build_dashboard_frames(get_day_rows(date, branch), shift)
+
+
+def get_trend(start, end, grain="day", shift=None, top_n=None, branch=None):
+    """Returns per-period, per-machine average Availability, Av Efficiency and OEE.
+
+    ``grain`` is a date_trunc unit (day/week/month), ``shift`` limits to one
+    Day/Night/Plan shift and ``top_n`` keeps only the N machines with the lowest
+    OEE over the range (None for all). Results are cached like get_day_rows().
+    """
+    key = (_resolve_branch(branch), start, end, grain, shift, top_n)
+    cached = _trend_cache.get(key)
+    if cached is not None and time.time() - cached[0] < DASHBOARD_TTL:
+        return cached[1]
+
+    engine = get_sqlalchemy_engine(key[0])
+    params = {"start": start, "end": end, "grain": grain, "shift": shift, "top_n": top_n}
+    with engine.connect() as conn:
+        trend = pd.read_sql(text(TREND_SQL), conn, params=params)
+
+    _cache_put(_trend_cache, key, trend)
+    return trend
+
+
+def worst_machines(trend):
+    """Returns the machines in a get_trend() result ranked from lowest to highest range OEE."""
+    return (
+        trend.drop_duplicates("machine")[["machine", "range_oee"]]
+        .rename(columns={"range_oee": "OEE (range avg)"})
+        .sort_values("OEE (range avg)", na_position="last")
+        .reset_index(drop=True)
+    )
@@ -0,0 +1,188 @@
+import gzip
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from collections import namedtuple
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+from sqlalchemy.sql import text
+from db import get_sqlalchemy_engine
+from extract_query import DATE_COLUMNS, PERIOD_COLUMN, build_extract_sql, compile_literal_sql, count_sql
+
+# ✅ Rows fetched from the server-side cursor and written per batch; memory stays flat for any range
+EXPORT_CHUNK_ROWS = 10000
+
+# Machine column per table, used with the month to partition Parquet exports
+MACHINE_COLUMNS = {"av": "machine", "archive": "Machine"}
+
+ExportResult = namedtuple("ExportResult", ["path", "row_counts", "seconds"])
+
+
+def count_rows(branch, spec):
+    sql, params = count_sql(spec)
+    engine = get_sqlalchemy_engine(branch)
+    with engine.connect() as conn:
+        return conn.execute(text(sql), params).scalar()
+
+
+def iter_table_chunks(branch, spec, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yields (columns, rows) batches of an ExtractSpec's result from a server-side cursor."""
+    sql, params = build_extract_sql(spec)
+    engine = get_sqlalchemy_engine(branch)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_rows).execute(text(sql), params)
+        columns = list(result.keys())
+        for rows in result.partitions():
+            yield columns, rows
+
+
+def write_excel(path, branch, specs, progress=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Streams each ExtractSpec's result into an .xlsx file, one sheet per table.
+
+    xlsxwriter's constant_memory mode flushes each row to disk as it is written,
+    so neither the result set nor the workbook is ever held in memory.
+    ``progress(fraction, message)`` is called after every chunk. Returns the row count per table.
+    """
+    totals = {spec.table: count_rows(branch, spec) for spec in specs}
+    grand_total = max(sum(totals.values()), 1)
+    written = 0
+    row_counts = {}
+
+    workbook = xlsxwriter.Workbook(path, {
+        "constant_memory": True,
+        "default_date_format": "yyyy-mm-dd",
+        "nan_inf_to_errors": True,
+    })
+    header_format = workbook.add_format({"bold": True})
+    try:
+        for spec in specs:
+            table = spec.table
+            sheet = workbook.add_worksheet(table)
+            row_index = 0
+            for columns, rows in iter_table_chunks(branch, spec, chunk_rows):
+                if row_index == 0:
+                    sheet.write_row(0, 0, columns, header_format)
+                    row_index = 1
+                for row in rows:
+                    sheet.write_row(row_index, 0, row)
+                    row_index += 1
+                written += len(rows)
+                if progress:
+                    progress(min(written / grand_total, 1.0), f"{table}: {row_index - 1:,} / {totals[table]:,} rows")
+            row_counts[table] = max(row_index - 1, 0)
+    finally:
+        workbook.close()
+    return row_counts
+
+
+def write_csv_gzip(path, branch, specs, progress=None):
+    """Writes a zip holding one gzip CSV per ExtractSpec, produced by COPY ... TO STDOUT.
+
+    Postgres formats the CSV itself and the bytes are compressed as they arrive,
+    so rows never become Python objects. Returns the row count per table.
+    """
+    row_counts = {}
+    engine = get_sqlalchemy_engine(branch)
+    conn = engine.raw_connection()
+    try:
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as archive, conn.cursor() as cur:
+            for i, spec in enumerate(specs):
+                table = spec.table
+                if progress:
+                    progress(i / len(specs), f"{table}: copying…")
+                # COPY takes no bind parameters, so the driver quotes them client-side via mogrify
+                sql, params = compile_literal_sql(spec, engine.dialect)
+                query = cur.mogrify(sql, params).decode()
+                with archive.open(f"{table}.csv.gz", "w") as member, gzip.GzipFile(fileobj=member, mode="wb") as gz:
+                    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", gz)
+                row_counts[table] = cur.rowcount
+        conn.rollback()
+    finally:
+        conn.close()
+    return row_counts
+
+
+def _partition_columns(spec, columns):
+    """Picks the month source and machine column present in a result (projection may drop them)."""
+    month_source = next((c for c in (PERIOD_COLUMN, DATE_COLUMNS[spec.table]) if c in columns), None)
+    machine = MACHINE_COLUMNS[spec.table] if MACHINE_COLUMNS[spec.table] in columns else None
+    return month_source, machine
+
+
+def write_parquet(path, branch, specs, progress=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Writes a zip of Parquet datasets, one per table, partitioned by month and machine.
+
+    Each streamed chunk is appended as new files in its partitions, so multi-month
+    pulls stay flat in memory and readers can prune by month or machine.
+    Returns the row count per table.
+    """
+    totals = {spec.table: count_rows(branch, spec) for spec in specs}
+    grand_total = max(sum(totals.values()), 1)
+    written = 0
+    row_counts = {}
+
+    root = tempfile.mkdtemp(prefix=f"{branch}_parquet_")
+    try:
+        for spec in specs:
+            table = spec.table
+            row_counts[table] = 0
+            for chunk_no, (columns, rows) in enumerate(iter_table_chunks(branch, spec, chunk_rows)):
+                df = pd.DataFrame.from_records(rows, columns=columns)
+                month_source, machine = _partition_columns(spec, columns)
+                partition_cols = []
+                if month_source:
+                    df["month"] = pd.to_datetime(df[month_source]).dt.strftime("%Y-%m")
+                    partition_cols.append("month")
+                if machine:
+                    df[machine] = df[machine].fillna("unknown")
+                    partition_cols.append(machine)
+                pq.write_to_dataset(
+                    pa.Table.from_pandas(df, preserve_index=False),
+                    root_path=os.path.join(root, table),
+                    partition_cols=partition_cols or None,
+                    basename_template=f"part-{chunk_no}-{{i}}.parquet",
+                )
+                row_counts[table] += len(rows)
+                written += len(rows)
+                if progress:
+                    progress(min(written / grand_total, 1.0), f"{table}: {row_counts[table]:,} / {totals[table]:,} rows")
+
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as archive:  # Parquet is already compressed
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    file_path = os.path.join(dirpath, filename)
+                    archive.write(file_path, os.path.relpath(file_path, root))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return row_counts
+
+
+ExportFormat = namedtuple("ExportFormat", ["writer", "extension", "mime"])
+
+EXPORT_FORMATS = {
+    "Excel (.xlsx)": ExportFormat(write_excel, "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV (gzip, zipped)": ExportFormat(write_csv_gzip, "csv.zip", "application/zip"),
+    "Parquet (partitioned by month/machine, zipped)": ExportFormat(write_parquet, "parquet.zip", "application/zip"),
+}
+
+
+def export_data(export_format, branch, specs, progress=None):
+    """Writes the ExtractSpecs' results in one of EXPORT_FORMATS to a temporary file.
+
+    Returns ExportResult(path, row_counts, seconds); the caller owns the file and
+    should delete it once it has been served.
+    """
+    started = time.perf_counter()
+    fmt = EXPORT_FORMATS[export_format]
+    fd, path = tempfile.mkstemp(prefix=f"{branch}_", suffix=f".{fmt.extension}")
+    os.close(fd)
+    try:
+        row_counts = fmt.writer(path, branch, specs, progress)
+    except Exception:
+        os.remove(path)
+        raise
+    return ExportResult(path, row_counts, time.perf_counter() - started)
@@ -1,86 +1,329 @@
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2
+import psycopg2.pool
 from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
 import streamlit as st
+from query_metrics import instrument_engine, instrumented_connection_factory, note_pool_wait
 
-def get_sqlalchemy_engine():
-    """Returns a SQLAlchemy engine for connecting to the correct PostgreSQL branch."""
-    
-    branch = st.session_state.get("branch", "main")  # Default to "main"
+# ✅ Defaults used when `[database.pool]` is not set in st.secrets
+POOL_DEFAULTS = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_timeout": 30,
+    "pool_recycle": 1800,
+    "pool_pre_ping": True,
+}
 
-    # Load database host from secrets based on the branch
+# ✅ libpq connection options for every engine and psycopg2 pool: an unreachable host fails
+# after connect_timeout, and TCP keepalives notice a host that dies mid-query
+# (`[database] connect_timeout` overrides the timeout)
+CONNECT_DEFAULTS = {
+    "connect_timeout": 10,
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+}
+
+# ✅ One engine (and therefore one connection pool) per branch for the whole process
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to check out a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            note_pool_wait(waited)
+            with self._wait_lock:
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+
+def get_pool_settings():
+    """Returns pool settings from `st.secrets["database"]["pool"]`, falling back to POOL_DEFAULTS."""
+    settings = dict(POOL_DEFAULTS)
+    configured = st.secrets["database"].get("pool", {})
+    for key in POOL_DEFAULTS:
+        if key in configured:
+            settings[key] = configured[key]
+    return settings
+
+
+def get_connect_options():
+    """Returns CONNECT_DEFAULTS with `[database] connect_timeout` applied."""
+    options = dict(CONNECT_DEFAULTS)
+    options["connect_timeout"] = st.secrets["database"].get("connect_timeout", options["connect_timeout"])
+    return options
+
+
+def get_sqlalchemy_url(branch):
+    """Builds the PostgreSQL URL for a branch, falling back to the main branch credentials."""
     db_host = st.secrets["database"]["hosts"].get(branch, st.secrets["database"]["hosts"]["main"])
     db_user = st.secrets["database"]["user"]
     db_password = st.secrets["branch_passwords"].get(branch, st.secrets["branch_passwords"]["main"])
     db_name = st.secrets["database"]["database"]  # Same database name, different branches
 
-    # ✅ Construct the database URL dynamically
-    db_url = f"postgresql://{db_user}:{db_password}@{db_host}/{db_name}"
+    return f"postgresql://{db_user}:{db_password}@{db_host}/{db_name}"
+
+
+def get_sqlalchemy_engine(branch=None):
+    """Returns the process-wide SQLAlchemy engine for a PostgreSQL branch.
+
+    Engines are created once per branch and reused across reruns and sessions,
+    so pages share a warm connection pool instead of reconnecting every run.
+    """
+    if branch is None:
+        branch = st.session_state.get("branch", "main")  # Default to "main"
+
+    engine = _engines.get(branch)
+    if engine is not None:
+        return engine
+
+    with _engines_lock:
+        engine = _engines.get(branch)
+        if engine is None:
+            engine = create_engine(
+                get_sqlalchemy_url(branch),
+                poolclass=TimedQueuePool,
+                # raw_connection() cursors are timed by the psycopg2 wrapper, the rest by engine events
+                connect_args={"connection_factory": instrumented_connection_factory(branch), **get_connect_options()},
+                **get_pool_settings(),
+            )
+            _engines[branch] = instrument_engine(engine, branch)
+    return engine
+
+
+def get_pool_stats():
+    """Returns a snapshot of pool usage for every engine created in this process."""
+    stats = []
+    for branch, engine in list(_engines.items()):
+        pool = engine.pool
+        checkouts = getattr(pool, "checkouts", 0)
+        total_wait = getattr(pool, "total_wait", 0.0)
+        stats.append({
+            "branch": branch,
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "checkouts": checkouts,
+            "avg_wait_ms": (total_wait / checkouts * 1000) if checkouts else 0.0,
+            "max_wait_ms": getattr(pool, "max_wait", 0.0) * 1000,
+        })
+    return stats
+
+
+# ✅ psycopg2 pool sizing, read from the same `[database.pool]` section
+PG_POOL_DEFAULTS = {
+    "min_connections": 1,
+    "max_connections": 10,
+    "pool_timeout": 30,
+}
+
+# ✅ Key of the dedicated pool used for authentication (always the main branch)
+MAIN_POOL_KEY = "__main_auth__"
+
+_pg_pools = {}
+_pg_pools_lock = threading.Lock()
+
+
+class PgConnectionPool:
+    """Thread-safe psycopg2 pool that waits up to a timeout when every connection is in use."""
+
+    def __init__(self, minconn, maxconn, timeout, **connect_kwargs):
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._timeout = timeout
+
+    def getconn(self):
+        """Checks out a healthy connection, replacing it if the server dropped it."""
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self._timeout):
+            raise psycopg2.pool.PoolError("Timed out waiting for a pooled database connection")
+        note_pool_wait(time.perf_counter() - start)
+        try:
+            conn = self._pool.getconn()
+            if not _is_connection_healthy(conn):
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        """Returns a connection to the pool, discarding it if it is broken."""
+        try:
+            self._pool.putconn(conn, close=close or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
 
-    return create_engine(db_url, pool_pre_ping=True)
 
-def get_db_connection():
-    """Establish and return a database connection based on the user's assigned branch."""
+def _is_connection_healthy(conn):
+    """Cheap liveness check run before handing a pooled connection out."""
+    if conn.closed:
+        return False
     try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def get_pg_pool_settings():
+    """Returns psycopg2 pool settings from st.secrets, falling back to PG_POOL_DEFAULTS."""
+    settings = dict(PG_POOL_DEFAULTS)
+    configured = st.secrets["database"].get("pool", {})
+    for key in PG_POOL_DEFAULTS:
+        if key in configured:
+            settings[key] = configured[key]
+    return settings
+
+
+def _get_connect_kwargs(branch):
+    """Returns psycopg2.connect() arguments for a branch (no fallback to main)."""
+    db_host = st.secrets["database"]["hosts"].get(branch)
+    db_password = st.secrets["branch_passwords"].get(branch)
+    db_user = st.secrets["database"]["user"]
+    db_name = st.secrets["database"]["database"]
+
+    if not db_host or not db_password:
+        raise ValueError(f"❌ Invalid database host or missing password for branch: {branch}")
+
+    return {"dbname": db_name, "user": db_user, "password": db_password, "host": db_host, "port": 5432}
+
+
+def get_pg_pool(branch=None):
+    """Returns the process-wide psycopg2 pool for a branch, or the auth pool for MAIN_POOL_KEY."""
+    if branch is None:
         branch = st.session_state.get("branch", "main")  # Default to 'main'
 
-        db_host = st.secrets["database"]["hosts"].get(branch)
-        db_password = st.secrets["branch_passwords"].get(branch)
-        db_user = st.secrets["database"]["user"]
-        db_name = st.secrets["database"]["database"]
+    pool = _pg_pools.get(branch)
+    if pool is not None:
+        return pool
 
-        if not db_host or not db_password:
-            raise ValueError(f"❌ Invalid database host or missing password for branch: {branch}")
+    with _pg_pools_lock:
+        pool = _pg_pools.get(branch)
+        if pool is None:
+            settings = get_pg_pool_settings()
+            target = "main" if branch == MAIN_POOL_KEY else branch
+            pool = PgConnectionPool(
+                settings["min_connections"],
+                settings["max_connections"],
+                settings["pool_timeout"],
+                connection_factory=instrumented_connection_factory(target),
+                **get_connect_options(),
+                **_get_connect_kwargs(target),
+            )
+            _pg_pools[branch] = pool
+    return pool
 
-        conn = psycopg2.connect(
-            dbname=db_name,
-            user=db_user,
-            password=db_password,
-            host=db_host,
-            port=5432
-        )
-        return conn
 
-    except Exception as e:
-        print(f"❌ Database connection failed: {e}")  # ✅ Log error instead of using `st.error()`
-        return None  # Return None to be handled by the caller
+@contextmanager
+def pooled_connection(branch=None):
+    """Checks a psycopg2 connection out of the branch pool for the duration of a `with` block.
+
+    The transaction is committed when the block exits normally and rolled back
+    if it raises; the connection always goes back to the pool.
+    """
+    pool = get_pg_pool(branch)
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def main_db_connection():
+    """Checks out a connection from the dedicated main-branch pool used for authentication."""
+    return pooled_connection(MAIN_POOL_KEY)
+
+
+# ✅ The branch catalogue rarely changes; admins' reruns read it from memory
+BRANCHES_TTL = 300  # seconds
+WARM_RETRY_SECONDS = 300  # a branch that failed to warm is not retried on every rerun
+
+_branches_cache = None  # (loaded_at, branches)
+_branches_lock = threading.Lock()
+_warmed_branches = set()
+_warm_retry_at = {}  # branch -> time before which a failed warm-up is not retried
+
+
+def fetch_branches():
+    """Reads the branch catalogue from the main database; raises if it cannot (no fallback, no cache)."""
+    with main_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT branch_name FROM public.branches ORDER BY branch_name")  # Explicit schema
+        return [row[0] for row in cur.fetchall()]
+
 
 def get_branches():
-    """Fetch available branches from the database."""
-    conn = get_db_connection()
-    if not conn:
-        return ["main"]  # Fallback to 'main' if DB connection fails
+    """Fetch available branches from the main database, cached for BRANCHES_TTL seconds."""
+    global _branches_cache
+    cached = _branches_cache
+    if cached is not None and time.time() - cached[0] < BRANCHES_TTL:
+        return list(cached[1])
 
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT branch_name FROM public.branches")  # Explicit schema
-        branches = [row[0] for row in cur.fetchall()]
-        return branches  # ✅ Return fetched branches
+        branches = fetch_branches()
     except Exception as e:
         print(f"❌ Failed to fetch branches: {e}")  # ✅ Log error instead of `st.error()`
-        return ["main"]
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()  # ✅ Ensure connection is always closed
-            
-def get_main_db_connection():
-    """Ensures connection to the main branch for authentication tasks."""
+        return ["main"]  # Fallback to 'main' if DB connection fails (not cached, so it retries)
+
+    with _branches_lock:
+        _branches_cache = (time.time(), branches)
+    return list(branches)
+
+
+def _warm_branch(branch):
     try:
-        db_host = st.secrets["database"]["hosts"]["main"]
-        db_password = st.secrets["branch_passwords"]["main"]
-        db_user = st.secrets["database"]["user"]
-        db_name = st.secrets["database"]["database"]
-
-        conn = psycopg2.connect(
-            dbname=db_name,
-            user=db_user,
-            password=db_password,
-            host=db_host,
-            port=5432
-        )
-        return conn
+        with get_sqlalchemy_engine(branch).connect():
+            pass  # Opens one connection that stays idle in the branch pool
+        get_pg_pool(branch)  # Opens min_connections psycopg2 connections
     except Exception as e:
-        print(f"❌ Authentication DB connection failed: {e}")
-        return None
+        print(f"❌ Failed to warm connection pools for branch {branch} (retry in {WARM_RETRY_SECONDS}s): {e}")
+        with _branches_lock:
+            _warmed_branches.discard(branch)
+            _warm_retry_at[branch] = time.time() + WARM_RETRY_SECONDS
+
+
+def warm_engines(branches):
+    """Opens the engine and psycopg2 pools of every branch in a background thread, once per process.
 
+    Switching branches then only selects an already-connected pool. A branch that failed
+    (unreachable, or no host configured) is retried after WARM_RETRY_SECONDS.
+    """
+    now = time.time()
+    with _branches_lock:
+        pending = [b for b in branches if b not in _warmed_branches and _warm_retry_at.get(b, 0) <= now]
+        _warmed_branches.update(pending)
+    if pending:
+        threading.Thread(
+            target=lambda: [_warm_branch(b) for b in pending], name="warm-engines", daemon=True
+        ).start()
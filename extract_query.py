@@ -0,0 +1,127 @@
+from dataclasses import dataclass, field
+from sqlalchemy.sql import text
+
+# ✅ Whitelisted columns per table; only these names are ever quoted into SQL,
+# every value (dates, filters) is a bound parameter.
+TABLE_COLUMNS = {
+    "av": ["date", "machine", "shift type", "hours", "shift", "T.production time",
+           "Availability", "Av Efficiency", "OEE"],
+    "archive": ["Date", "Machine", "Day/Night/plan", "Activity", "time", "Product", "batch number",
+                "quantity", "comments", "rate", "standard rate", "efficiency"],
+}
+DATE_COLUMNS = {"av": "date", "archive": "Date"}
+
+# Filter name -> column per table; filters a table lacks (e.g. product on av) are ignored for it
+FILTER_COLUMNS = {
+    "av": {"machines": "machine", "shifts": "shift"},
+    "archive": {"machines": "Machine", "shifts": "Day/Night/plan", "activities": "Activity", "products": "Product"},
+}
+
+AGGREGATE_FUNCTIONS = {"sum": "SUM", "avg": "AVG", "min": "MIN", "max": "MAX"}
+GRAINS = ("day", "week", "month")
+PERIOD_COLUMN = "period"
+COUNT_COLUMN = "rows"
+
+
+@dataclass(frozen=True)
+class ExtractSpec:
+    """What to extract from one table.
+
+    ``columns`` projects raw rows (None for all). Setting ``aggregates``
+    ({column: "sum"/"avg"/"min"/"max"}) switches to a server-side GROUP BY over
+    ``group_by`` columns plus a ``period`` column when ``grain`` (day/week/month) is set.
+    """
+    table: str
+    start_date: object
+    end_date: object
+    machines: tuple = ()
+    shifts: tuple = ()
+    activities: tuple = ()
+    products: tuple = ()
+    columns: tuple = None
+    group_by: tuple = ()
+    aggregates: dict = field(default_factory=dict)
+    grain: str = None
+
+
+def _quote(table, column):
+    if column not in TABLE_COLUMNS[table]:
+        raise ValueError(f"❌ Unknown column for {table}: {column}")
+    return '"' + column + '"'
+
+
+def _select_list(spec):
+    if not spec.aggregates:
+        if spec.grain or spec.group_by:
+            raise ValueError("❌ group_by/grain need at least one aggregate")
+        return ", ".join(_quote(spec.table, c) for c in spec.columns) if spec.columns else "*", ""
+
+    keys = []
+    if spec.grain:
+        if spec.grain not in GRAINS:
+            raise ValueError(f"❌ Unknown grain: {spec.grain}")
+        keys.append(f"date_trunc('{spec.grain}', {_quote(spec.table, DATE_COLUMNS[spec.table])})::date AS {PERIOD_COLUMN}")
+    keys += [_quote(spec.table, c) for c in spec.group_by]
+
+    values = []
+    for column, func in spec.aggregates.items():
+        if func not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"❌ Unknown aggregate: {func}")
+        values.append(f'{AGGREGATE_FUNCTIONS[func]}({_quote(spec.table, column)}) AS "{func}_{column}"')
+    values.append(f"COUNT(*) AS {COUNT_COLUMN}")
+
+    group_by = ""
+    if keys:
+        positions = ", ".join(str(i + 1) for i in range(len(keys)))
+        group_by = f" GROUP BY {positions} ORDER BY {positions}"
+    return ", ".join(keys + values), group_by
+
+
+def build_extract_sql(spec):
+    """Returns (SQL, params) for an ExtractSpec; list filters bind as arrays (= ANY) so the
+    statement text only changes with the chosen filters, not with their values."""
+    if spec.table not in TABLE_COLUMNS:
+        raise ValueError(f"❌ Unknown table: {spec.table}")
+    select, group_by = _select_list(spec)
+
+    where = [f'{_quote(spec.table, DATE_COLUMNS[spec.table])} BETWEEN :start AND :end']
+    params = {"start": spec.start_date, "end": spec.end_date}
+    for name, column in FILTER_COLUMNS[spec.table].items():
+        values = getattr(spec, name)
+        if values:
+            where.append(f"{_quote(spec.table, column)} = ANY(:{name})")
+            params[name] = list(values)
+
+    sql = f"SELECT {select} FROM {spec.table} WHERE {' AND '.join(where)}{group_by}"
+    return sql, params
+
+
+def count_sql(spec):
+    """Returns (SQL, params) counting the rows build_extract_sql(spec) yields."""
+    sql, params = build_extract_sql(spec)
+    return f"SELECT COUNT(*) FROM ({sql}) AS extract", params
+
+
+def compile_literal_sql(spec, dialect):
+    """Renders the extract SQL with its parameters inlined by the driver, for COPY (which takes no binds)."""
+    sql, params = build_extract_sql(spec)
+    compiled = text(sql).bindparams(**params).compile(dialect=dialect)
+    return str(compiled), compiled.params
+
+
+# Summaries offered by the extract page: per-period totals/averages per machine and shift
+SUMMARY_PRESETS = {
+    "av": {
+        "group_by": ("machine", "shift"),
+        "aggregates": {"T.production time": "sum", "Availability": "avg", "Av Efficiency": "avg", "OEE": "avg"},
+    },
+    "archive": {
+        "group_by": ("Machine", "Day/Night/plan", "Activity"),
+        "aggregates": {"time": "sum", "quantity": "sum", "efficiency": "avg"},
+    },
+}
+
+
+def summary_spec(table, start_date, end_date, grain, **filters):
+    """Returns an ExtractSpec that aggregates a table with its SUMMARY_PRESETS entry at ``grain``."""
+    return ExtractSpec(table, start_date, end_date, grain=grain, **SUMMARY_PRESETS[table], **filters)
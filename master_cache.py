@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import namedtuple
+import pandas as pd
+from sqlalchemy.sql import text
+import streamlit as st
+from db import get_sqlalchemy_engine
+
+# ✅ Master data changes a few times a week, so a long TTL is safe; edits invalidate explicitly
+MASTER_DATA_TTL = 600  # seconds
+
+# machines: DataFrame(name, qty_uom), products: DataFrame(id, name),
+# rates: {(product, machine): standard_rate}
+MasterData = namedtuple("MasterData", ["machines", "products", "rates", "loaded_at"])
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _resolve_branch(branch):
+    return branch if branch is not None else st.session_state.get("branch", "main")
+
+
+def _load_master_data(branch):
+    """Reads machines, products and the full product×machine rate matrix in one connection."""
+    engine = get_sqlalchemy_engine(branch)
+    with engine.connect() as conn:
+        machines = pd.read_sql(text("SELECT name, qty_uom FROM machines ORDER BY name"), conn)
+        products = pd.read_sql(text("SELECT id, name FROM products ORDER BY name"), conn)
+        rate_rows = conn.execute(text("SELECT product, machine, standard_rate FROM rates")).fetchall()
+
+    rates = {(product, machine): standard_rate for product, machine, standard_rate in rate_rows}
+    return MasterData(machines, products, rates, time.time())
+
+
+def get_master_data(branch=None):
+    """Returns the cached master data for a branch, reloading it once the TTL has expired."""
+    branch = _resolve_branch(branch)
+
+    data = _cache.get(branch)
+    if data is not None and time.time() - data.loaded_at < MASTER_DATA_TTL:
+        return data
+
+    with _cache_lock:
+        data = _cache.get(branch)
+        if data is None or time.time() - data.loaded_at >= MASTER_DATA_TTL:
+            data = _load_master_data(branch)
+            _cache[branch] = data
+    return data
+
+
+def invalidate_master_data(branch=None):
+    """Drops the cached master data for a branch so the next read sees fresh edits."""
+    with _cache_lock:
+        _cache.pop(_resolve_branch(branch), None)
+
+
+def get_machine_names(branch=None):
+    """Returns machine names ordered by name."""
+    return get_master_data(branch).machines["name"].tolist()
+
+
+def get_products(branch=None):
+    """Returns a copy of the (id, name) products table ordered by name."""
+    return get_master_data(branch).products.copy()
+
+
+def get_product_names(branch=None):
+    """Returns product names ordered by name."""
+    return get_master_data(branch).products["name"].tolist()
+
+
+def get_product_rates(product, branch=None):
+    """Returns every machine with its standard rate for a product (0 where none is defined)."""
+    data = get_master_data(branch)
+    df = data.machines.rename(columns={"name": "machine"})
+    rates = [data.rates.get((product, machine)) for machine in df["machine"]]
+    df["standard_rate"] = pd.to_numeric(pd.Series(rates, index=df.index, dtype=object), errors="coerce").fillna(0.0)
+    return df[["machine", "standard_rate", "qty_uom"]]
+
+
+def resolve_standard_rates(products, machine, branch=None):
+    """Looks up the standard rate of each product on a machine from the cached matrix.
+
+    Returns ``(rates, missing, invalid)`` where ``rates`` maps product -> float
+    and unusable entries are listed so the caller can report them in one batch.
+    """
+    matrix = get_master_data(branch).rates
+    rates, missing, invalid = {}, [], []
+    for product in products:
+        value = matrix.get((product, machine))
+        if value is None:
+            missing.append(product)
+            continue
+        try:
+            rate = float(value)
+        except (TypeError, ValueError):
+            invalid.append(f"{product} ({value})")
+            continue
+        if rate == 0:
+            missing.append(product)
+        else:
+            rates[product] = rate
+    return rates, missing, invalid
@@ -0,0 +1,267 @@
+import argparse
+import datetime
+import json
+from collections import namedtuple
+from sqlalchemy.sql import text
+import streamlit as st
+from db import get_sqlalchemy_engine
+from shift_store import AV_DEDUPE_SQL, AV_DUPLICATE_KEYS_SQL, AV_UNIQUE_INDEX_SQL
+from dashboard_data import DASHBOARD_SQL
+from daily_summary import BACKFILL_SQL, CREATE_SUMMARY_SQL
+
+# ✅ Each migration runs once per branch database, in version order, each inside its own transaction.
+# statements: SQL strings or callables taking the connection (for steps that need to inspect data).
+# checks: (description, query, params, expected index name(s)) verified with EXPLAIN after applying.
+Migration = namedtuple("Migration", ["version", "name", "statements", "checks"])
+
+_SAMPLE = {"date": datetime.date(2000, 1, 1), "shift": "Day", "machine": ""}
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS archive (
+        "Date" date,
+        "Machine" text,
+        "Day/Night/plan" text,
+        "Activity" text,
+        "time" double precision,
+        "Product" text,
+        "batch number" text,
+        "quantity" double precision,
+        "comments" text,
+        "rate" double precision,
+        "standard rate" double precision,
+        "efficiency" double precision
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS av (
+        "date" date,
+        "machine" text,
+        "shift type" text,
+        "hours" double precision,
+        "shift" text,
+        "T.production time" double precision,
+        "Availability" double precision,
+        "Av Efficiency" double precision,
+        "OEE" double precision
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS machines (
+        name text PRIMARY KEY,
+        qty_uom text
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        id serial PRIMARY KEY,
+        name text NOT NULL UNIQUE,
+        batch_size double precision,
+        units_per_box double precision,
+        primary_units_per_box double precision,
+        oracle_code text
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rates (
+        product text NOT NULL,
+        machine text NOT NULL,
+        standard_rate double precision,
+        UNIQUE (product, machine)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id serial PRIMARY KEY,
+        username text NOT NULL UNIQUE,
+        password text NOT NULL,
+        role text NOT NULL,
+        branch text
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS public.branches (
+        branch_name text PRIMARY KEY
+    )
+    """,
+]
+
+
+class MigrationError(Exception):
+    """Raised by a migration step when the data must be fixed by hand before it can be applied."""
+
+
+def dedupe_av_keys(conn):
+    """Drops identical duplicate av rows so the unique shift key can be built.
+
+    Raises MigrationError listing every (date, shift, machine) whose duplicate rows differ.
+    """
+    removed = conn.exec_driver_sql(AV_DEDUPE_SQL).rowcount
+    if removed:
+        print(f"🧹 Removed {removed} duplicate av rows")
+    conflicts = conn.exec_driver_sql(AV_DUPLICATE_KEYS_SQL).fetchall()
+    if conflicts:
+        keys = "; ".join(f"{date} / {shift} / {machine} ({rows} rows)" for date, shift, machine, rows in conflicts)
+        raise MigrationError(
+            f"av holds conflicting reports for {len(conflicts)} shifts, re-save them with replace "
+            f"or delete the extra av rows, then re-run: {keys}"
+        )
+
+
+CREATE_INDEXES = [
+    # Duplicate checks, replace, dashboard activity summary and extract date ranges
+    'CREATE INDEX IF NOT EXISTS archive_date_shift_machine_idx ON archive ("Date", "Day/Night/plan", "Machine")',
+    # Production summary / batch output only ever read Production rows
+    'CREATE INDEX IF NOT EXISTS archive_production_idx ON archive ("Date", "Day/Night/plan", "Machine", "batch number") '
+    "WHERE \"Activity\" = 'Production'",
+    # One av row per (date, shift, machine); also serves av lookups by date/shift
+    AV_UNIQUE_INDEX_SQL,
+]
+
+INDEX_CHECKS = [
+    (
+        "production summary",
+        'SELECT "Machine", "batch number", SUM("quantity") FROM archive '
+        "WHERE \"Activity\" = 'Production' AND \"Date\" = :date AND \"Day/Night/plan\" = :shift "
+        'GROUP BY "Machine", "batch number"',
+        _SAMPLE,
+        "archive_production_idx",
+    ),
+    (
+        "shift report existence check",
+        'SELECT 1 FROM archive WHERE "Date" = :date AND "Day/Night/plan" = :shift AND "Machine" = :machine',
+        _SAMPLE,
+        "archive_date_shift_machine_idx",
+    ),
+]
+
+SUMMARY_CHECKS = [
+    (
+        "dashboard day data",
+        DASHBOARD_SQL,
+        _SAMPLE,
+        ("archive_production_idx", "av_date_shift_machine_key", "daily_machine_summary_pkey"),
+    ),
+]
+
+MIGRATIONS = [
+    Migration(1, "create tables", CREATE_TABLES, []),
+    Migration(2, "archive/av composite indexes and unique shift key", [dedupe_av_keys] + CREATE_INDEXES, INDEX_CHECKS),
+    Migration(3, "daily_machine_summary rollup", [CREATE_SUMMARY_SQL, BACKFILL_SQL], SUMMARY_CHECKS),
+]
+
+_VERSION_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version integer PRIMARY KEY,
+        name text NOT NULL,
+        applied_at timestamptz NOT NULL DEFAULT now()
+    )
+"""
+
+# ✅ Stops two processes from migrating the same branch at once
+_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))"
+
+
+def _plan_index_names(plan):
+    """Collects every "Index Name" used anywhere in an EXPLAIN (FORMAT JSON) plan tree."""
+    names = set()
+    if "Index Name" in plan:
+        names.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        names |= _plan_index_names(child)
+    return names
+
+
+def explain_uses_index(conn, query, params, index_names):
+    """Returns True if the planner can answer ``query`` using every index in ``index_names``.
+
+    Sequential scans are disabled for the check so that small or empty tables,
+    where a seq scan is cheaper, still prove the index is usable.
+    """
+    conn.execute(text("SET LOCAL enable_seqscan = off"))
+    result = conn.execute(text("EXPLAIN (FORMAT JSON) " + query), params).scalar()
+    plan = result if isinstance(result, list) else json.loads(result)
+    if isinstance(index_names, str):
+        index_names = (index_names,)
+    return set(index_names) <= _plan_index_names(plan[0]["Plan"])
+
+
+def run_checks(conn, checks):
+    """Runs EXPLAIN checks; returns a list of descriptions whose expected index is not used."""
+    failures = []
+    for description, query, params, index_names in checks:
+        if not explain_uses_index(conn, query, params, index_names):
+            failures.append(f"{description} does not use {index_names}")
+    return failures
+
+
+def applied_versions(conn):
+    conn.execute(text(_VERSION_TABLE_SQL))
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def migrate(branch, check_only=False):
+    """Applies pending migrations to one branch database and verifies their index checks.
+
+    Returns (applied versions, check failures). A migration that raises MigrationError is
+    rolled back on its own, reported as a failure and stops the later ones.
+    """
+    engine = get_sqlalchemy_engine(branch)
+    applied, failures = [], []
+    for migration in [] if check_only else MIGRATIONS:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(_LOCK_SQL))
+                if migration.version in applied_versions(conn):
+                    continue
+                for statement in migration.statements:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.exec_driver_sql(statement)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                    {"version": migration.version, "name": migration.name},
+                )
+        except MigrationError as e:
+            failures.append(f"migration {migration.version} ({migration.name}) not applied: {e}")
+            break
+        applied.append(migration.version)
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+
+    # ✅ Checks run in their own transaction so SET LOCAL does not leak into the pool
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            for migration in MIGRATIONS:
+                if migration.version in done:
+                    failures += run_checks(conn, migration.checks)
+        finally:
+            trans.rollback()
+    return applied, failures
+
+
+def migrate_all(check_only=False):
+    """Runs migrate() for every branch host configured in st.secrets."""
+    return {branch: migrate(branch, check_only) for branch in st.secrets["database"]["hosts"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply schema migrations to branch databases.")
+    parser.add_argument("--branch", help="only migrate this branch (default: all branches)")
+    parser.add_argument("--check-only", action="store_true", help="only run the EXPLAIN index checks")
+    args = parser.parse_args(argv)
+
+    results = {args.branch: migrate(args.branch, args.check_only)} if args.branch else migrate_all(args.check_only)
+    ok = True
+    for branch, (applied, failures) in results.items():
+        print(f"✅ {branch}: applied {applied or 'nothing'}")
+        for failure in failures:
+            ok = False
+            print(f"❌ {branch}: {failure}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
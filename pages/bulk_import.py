@@ -0,0 +1,59 @@
+import streamlit as st
+import pandas as pd
+from auth import check_authentication, check_access
+from shift_import import import_shift_reports
+from dashboard_data import invalidate_dashboard
+
+# Hide Streamlit's menu and "Manage app" button
+st.markdown("""
+    <style>
+        [data-testid="stToolbar"] {visibility: hidden !important;}
+        [data-testid="manage-app-button"] {display: none !important;}
+        header {visibility: hidden !important;}
+        footer {visibility: hidden !important;}
+    </style>
+""", unsafe_allow_html=True)
+
+# ✅ Only admins can backfill historical reports
+check_authentication()
+check_access(["admin"])
+
+st.title("📂 Bulk Import Shift Reports")
+st.write("Upload archive and av files with the same columns as `archive.csv` / `av.csv`. "
+         "Existing reports for the same Date, Shift and Machine are replaced.")
+
+branch = st.session_state.get("branch", "main")
+archive_file = st.file_uploader("Archive file", type=["csv", "xlsx"])
+av_file = st.file_uploader("AV file", type=["csv", "xlsx"])
+dry_run = st.checkbox("Validate only (do not write)", value=True)
+
+if st.button("Import"):
+    if not archive_file or not av_file:
+        st.error("Please upload both the archive and the av file.")
+        st.stop()
+
+    status = st.empty()
+    try:
+        result = import_shift_reports(
+            archive_file, av_file, branch=branch, dry_run=dry_run,
+            progress=lambda table, rows: status.info(f"⏳ {table}: {rows} rows loaded"),
+        )
+    except Exception as e:
+        st.error(f"❌ Import failed: {e}")
+        st.stop()
+
+    status.empty()
+    if not dry_run:
+        invalidate_dashboard(branch=branch)
+    if dry_run:
+        st.success(f"✅ {len(result.loaded_keys)} shifts passed validation ({result.seconds:.1f}s).")
+    else:
+        st.success(f"✅ {len(result.loaded_keys)} shifts imported: {result.archive_rows} archive rows, "
+                   f"{result.av_rows} av rows in {result.seconds:.1f}s.")
+
+    if result.rejected:
+        st.warning(f"⚠️ {len(result.rejected)} shifts were rejected.")
+        st.dataframe(pd.DataFrame(
+            [(key[0], key[1], key[2], reason) for key, reason in sorted(result.rejected.items())],
+            columns=["Date", "Shift", "Machine", "Reason"],
+        ))
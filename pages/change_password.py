@@ -1,7 +1,7 @@
 import streamlit as st
-import bcrypt
-import psycopg2
-from db import get_main_db_connection  # Ensure it connects to the 'main' branch
+from db import main_db_connection  # Ensure it connects to the 'main' branch
+from passwords import hash_password, verify_password
+from session_tokens import persist_session, restore_session, revoke_user_sessions
 
 # Hide Streamlit's menu and "Manage app" button
 st.markdown("""
@@ -14,35 +14,28 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 def update_password(username, old_password, new_password):
-    conn = get_main_db_connection()  # Connect to the main branch
-    if not conn:
-        st.error("Database connection failed.")
-        return False
-
     try:
-        cur = conn.cursor()
+        with main_db_connection() as conn, conn.cursor() as cur:  # Pooled connection to the main branch
+            # Fetch the user's current hashed password
+            cur.execute("SELECT password FROM users WHERE username = %s", (username,))
+            user = cur.fetchone()
 
-        # Fetch the user's current hashed password
-        cur.execute("SELECT password FROM users WHERE username = %s", (username,))
-        user = cur.fetchone()
+            if not user:
+                st.error("User not found.")
+                return False
 
-        if not user:
-            st.error("User not found.")
-            return False
+            stored_password = user[0].strip()  # Ensure no spaces
 
-        stored_password = user[0].strip()  # Ensure no spaces
+            # Verify old password (bcrypt runs in the shared process pool)
+            if not verify_password(old_password, stored_password):
+                st.error("Old password is incorrect.")
+                return False
 
-        # Verify old password
-        if not bcrypt.checkpw(old_password.encode(), stored_password.encode()):
-            st.error("Old password is incorrect.")
-            return False
+            # Hash the new password
+            hashed_new_password = hash_password(new_password)
 
-        # Hash the new password
-        hashed_new_password = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
-
-        # Update the password in the database
-        cur.execute("UPDATE users SET password = %s WHERE username = %s", (hashed_new_password, username))
-        conn.commit()
+            # Update the password in the database (committed when the block exits)
+            cur.execute("UPDATE users SET password = %s WHERE username = %s", (hashed_new_password, username))
 
         st.success("Password updated successfully!")
         return True
@@ -52,16 +45,13 @@ def update_password(username, old_password, new_password):
         st.write(f"DEBUG: {e}")  # Log error for debugging
         return False
 
-    finally:
-        cur.close()
-        conn.close()
-
 # UI for password change
 st.title("Change Password")
 
-if "authenticated" not in st.session_state or not st.session_state["authenticated"]:
+if not st.session_state.get("authenticated") and not restore_session():
     st.warning("You must be logged in to change your password.")
     st.stop()
+persist_session()
 
 st.write(f"Logged in as: **{st.session_state['username']}**")
 
@@ -75,5 +65,9 @@ if st.button("Update Password"):
     elif len(new_password) < 6:
         st.error("New password must be at least 6 characters long.")
     else:
-        update_password(st.session_state["username"], old_password, new_password)
+        if update_password(st.session_state["username"], old_password, new_password):
+            # ✅ Sign out every other session of this user; this one gets a fresh token
+            revoke_user_sessions(st.session_state["username"])
+            st.session_state.pop("session_token", None)
+            persist_session()
 
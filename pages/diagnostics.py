@@ -0,0 +1,61 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from auth import check_authentication, check_access
+from db import get_pool_stats
+from passwords import get_login_latency_stats
+from query_metrics import (
+    SAMPLE_WINDOW, get_samples, get_slow_queries, get_slow_query_ms,
+    latency_histogram, page_summary, reset_metrics,
+)
+
+# ✅ Hide Streamlit's menu and sidebar
+st.markdown("""
+    <style>
+        [data-testid="stToolbar"] {visibility: hidden !important;}
+        [data-testid="manage-app-button"] {display: none !important;}
+        header {visibility: hidden !important;}
+        footer {visibility: hidden !important;}
+    </style>
+""", unsafe_allow_html=True)
+
+# ✅ Authenticate and enforce role-based access
+check_authentication()
+check_access(["admin"])
+
+st.title("🩺 Database Diagnostics")
+st.caption(
+    f"Covers the last {SAMPLE_WINDOW:,} queries issued by this server process. "
+    f"Queries slower than {get_slow_query_ms():.0f} ms are logged."
+)
+
+samples = get_samples()
+if st.button("🔄 Reset metrics"):
+    reset_metrics()
+    st.rerun()
+
+# ✅ Which page is hammering Postgres
+st.subheader("📄 Queries per Page")
+summary = pd.DataFrame(page_summary(samples))
+if summary.empty:
+    st.info("No queries recorded yet.")
+else:
+    st.dataframe(summary.round(1), hide_index=True)
+
+st.subheader("📊 Query Latency Histogram")
+histogram = pd.DataFrame(latency_histogram(samples), columns=["latency", "queries"])
+st.plotly_chart(px.bar(histogram, x="latency", y="queries"))
+
+st.subheader("🐢 Slow Queries")
+slow = pd.DataFrame(get_slow_queries())
+if slow.empty:
+    st.info("No slow queries recorded.")
+else:
+    slow["at"] = pd.to_datetime(slow["at"], unit="s")
+    st.dataframe(slow.round(1), hide_index=True)
+
+st.subheader("🔌 Connection Pools")
+st.dataframe(pd.DataFrame(get_pool_stats()).round(1), hide_index=True)
+
+st.subheader("🔐 Login Latency")
+st.json(get_login_latency_stats())
@@ -1,7 +1,8 @@
+import os
 import streamlit as st
-import pandas as pd
-from db import get_sqlalchemy_engine
-from io import BytesIO
+from data_export import EXPORT_FORMATS, export_data
+from extract_query import TABLE_COLUMNS, ExtractSpec, summary_spec
+from master_cache import get_machine_names, get_product_names
 from auth import check_authentication
 
 # Hide Streamlit's menu and "Manage app" button
@@ -14,28 +15,6 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-def fetch_data(engine, table, start_date, end_date):
-    """Fetch data from a given table between two dates."""
-    column_mapping = {
-        "av": "date",
-        "archive": "Date"
-    }
-    date_column = column_mapping[table]
-    query = f"""
-        SELECT * FROM {table}
-        WHERE "{date_column}" BETWEEN '{start_date}' AND '{end_date}'
-    """
-    return pd.read_sql(query, con=engine)
-
-def generate_excel(av_df, archive_df, branch, start_date, end_date):
-    """Generate an Excel file with two sheets."""
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        av_df.to_excel(writer, sheet_name='av', index=False)
-        archive_df.to_excel(writer, sheet_name='archive', index=False)
-    filename = f"{branch}_{start_date}_to_{end_date}.xlsx"
-    return output.getvalue(), filename
-
 # Authenticate user
 check_authentication()
 
@@ -44,23 +23,70 @@ st.title("Extract Data")
 # Select date range
 start_date = st.date_input("Start Date")
 end_date = st.date_input("End Date")
+export_format = st.selectbox("Format", list(EXPORT_FORMATS))
+
+# ✅ Filters, projection and aggregation all run in Postgres; only the requested data is transferred
+ACTIVITIES = ["Production", "Maintenance DT", "Production DT", "Material DT", "Utility DT",
+              "QC DT", "Cleaning DT", "QA DT", "Changeover DT"]
+SUMMARY_GRAINS = {"Raw rows": None, "Daily": "day", "Weekly": "week", "Monthly": "month"}
+
+with st.expander("Filters"):
+    filters = {
+        "machines": tuple(st.multiselect("Machines", get_machine_names())),
+        "shifts": tuple(st.multiselect("Shifts", ["Day", "Night", "Plan"])),
+        "activities": tuple(st.multiselect("Activities (archive only)", ACTIVITIES)),
+        "products": tuple(st.multiselect("Products (archive only)", get_product_names())),
+    }
+
+summary = st.selectbox("Rows", list(SUMMARY_GRAINS),
+                       help="Summaries are totals/averages per machine and shift (and activity for archive).")
+columns = {}
+if SUMMARY_GRAINS[summary] is None:
+    with st.expander("Columns"):
+        for table, table_columns in TABLE_COLUMNS.items():
+            columns[table] = st.multiselect(f"{table} columns", table_columns, default=table_columns)
+
+
+def build_specs():
+    if SUMMARY_GRAINS[summary] is not None:
+        return [summary_spec(table, start_date, end_date, SUMMARY_GRAINS[summary], **filters) for table in TABLE_COLUMNS]
+    return [
+        ExtractSpec(table, start_date, end_date, columns=tuple(columns[table]), **filters)
+        for table in TABLE_COLUMNS
+    ]
 
 if st.button("Extract Data"):
     if start_date > end_date:
         st.error("Start date cannot be after end date.")
+    elif not all(columns.values()):
+        st.error("Select at least one column for each table.")
     else:
         branch = st.session_state.get("branch", "main")
-        engine = get_sqlalchemy_engine()
-        
-        av_data = fetch_data(engine, "av", start_date, end_date)
-        archive_data = fetch_data(engine, "archive", start_date, end_date)
-        
-        excel_data, filename = generate_excel(av_data, archive_data, branch, start_date, end_date)
-        
-        st.download_button(
-            label="Download Excel File",
-            data=excel_data,
-            file_name=filename,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        progress_bar = st.progress(0.0, text="Starting export…")
+
+        # ✅ Rows stream from the server straight into the export file
+        try:
+            result = export_data(export_format, branch, build_specs(),
+                                 progress=lambda fraction, message: progress_bar.progress(fraction, text=message))
+        except Exception as e:
+            progress_bar.empty()
+            st.error(f"❌ Export failed: {e}")
+            st.stop()
+
+        progress_bar.progress(1.0, text="Export ready")
+        st.caption(
+            f"{result.row_counts['av']:,} av rows and {result.row_counts['archive']:,} archive rows "
+            f"exported in {result.seconds:.1f}s"
         )
 
+        with open(result.path, "rb") as f:
+            export_bytes = f.read()
+        os.remove(result.path)
+
+        fmt = EXPORT_FORMATS[export_format]
+        st.download_button(
+            label=f"Download {export_format}",
+            data=export_bytes,
+            file_name=f"{branch}_{start_date}_to_{end_date}.{fmt.extension}",
+            mime=fmt.mime
+        )
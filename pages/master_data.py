@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 from sqlalchemy.sql import text
 from db import get_sqlalchemy_engine
+from master_cache import get_products, get_product_rates, invalidate_master_data
 from auth import check_authentication, check_access
 
 # Hide Streamlit's menu and "Manage app" button
@@ -30,12 +31,9 @@ with st.expander("✏️ Edit Product Definition", expanded=False):
     st.markdown("### Add/Edit Product Details")
 
     def fetch_products():
-        """Fetch product names and IDs from the database."""
-        query = text("SELECT id, name FROM products ORDER BY name")
+        """Fetch product names and IDs from the shared master-data cache."""
         try:
-            with engine.connect() as conn:
-                df = pd.read_sql(query, conn)
-            return df
+            return get_products()
         except Exception as e:
             st.error(f"❌ Error fetching products: {e}")
             return pd.DataFrame()
@@ -93,6 +91,7 @@ with st.expander("✏️ Edit Product Definition", expanded=False):
                             "name": name, "batch_size": batch_size, "units_per_box": units_per_box,
                             "primary_units_per_box": primary_units_per_box, "oracle_code": oracle_code
                         })
+                    invalidate_master_data()  # ✅ Make the edit visible on every page immediately
                     st.success("✅ Product saved successfully!")
                 except Exception as e:
                     st.error(f"❌ Error saving product: {e}")
@@ -113,17 +112,9 @@ with st.expander("⚙️ Edit Product Standard Rate", expanded=False):
     selected_product = st.selectbox("Select a product", ["Select"] + product_list)
 
     def fetch_rates(product):
-        """Fetch existing rates for a product."""
-        query = text("""
-            SELECT m.name AS machine, COALESCE(r.standard_rate, 0) AS standard_rate, m.qty_uom
-            FROM machines m
-            LEFT JOIN rates r ON m.name = r.machine AND r.product = :product
-            ORDER BY m.name
-        """)
+        """Fetch existing rates for a product from the cached rate matrix."""
         try:
-            with engine.connect() as conn:
-                df = pd.read_sql(query, conn, params={"product": product})
-            return df
+            return get_product_rates(product)
         except Exception as e:
             st.error(f"❌ Error fetching rates: {e}")
             return pd.DataFrame()
@@ -164,6 +155,7 @@ with st.expander("⚙️ Edit Product Standard Rate", expanded=False):
                         with engine.begin() as conn:  # ✅ Use `begin()` instead of commit
                             for machine, rate in updated_rates.items():
                                 conn.execute(query, {"product": selected_product, "machine": machine, "standard_rate": rate})
+                        invalidate_master_data()  # ✅ Make the edit visible on every page immediately
                         st.success("✅ Rates updated successfully!")
                     except Exception as e:
                         st.error(f"❌ Error saving rates: {e}")
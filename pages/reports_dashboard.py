@@ -1,16 +1,12 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from sqlalchemy.sql import text
-from db import get_sqlalchemy_engine
-from auth import check_authentication, check_access
-import io
-import plotly.io as pio
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.utils import ImageReader
-from textwrap import wrap
-from bs4 import BeautifulSoup
+import datetime
+from dashboard_data import DashboardFrames, TREND_GRAINS, get_dashboard_frames, get_trend, worst_machines
+from auth import ROLE_ACCESS, check_authentication, check_access
+from cross_branch import get_plant_av, get_plant_trend, plant_summary
+import time
+from report_render import render_html, render_pdf_async
 # ✅ Hide Streamlit's menu and sidebar
 st.markdown("""
     <style>
@@ -25,136 +21,112 @@ st.markdown("""
 check_authentication()
 check_access(["user", "power user", "admin", "report"])
 
-# ✅ Get database engine
-engine = get_sqlalchemy_engine()
+# ✅ Function to Fetch Data from PostgreSQL (one round trip per date, cached per branch)
+def get_data(date, shift):
+    try:
+        return get_dashboard_frames(date, shift)
+    except Exception as e:
+        st.error(f"❌ Database connection failed: {e}")
+        return DashboardFrames(pd.DataFrame(), pd.DataFrame(), pd.DataFrame())
+
+def render_trend_view():
+    """Date-range trend of Availability, Av Efficiency and OEE per machine (aggregated in SQL)."""
+    today = datetime.date.today()
+    col1, col2 = st.columns(2)
+    start_date = col1.date_input("📅 Start Date", value=today - datetime.timedelta(days=30))
+    end_date = col2.date_input("📅 End Date", value=today)
+    col1, col2, col3 = st.columns(3)
+    grain_label = col1.selectbox("Rollup", list(TREND_GRAINS), index=1)
+    shift = col2.selectbox("🕒 Shift Type", ["All", "Day", "Night", "Plan"])
+    top_n = col3.number_input("Worst N machines (0 = all)", min_value=0, value=5, step=1)
+    metric = st.radio("Metric", ["OEE", "Availability", "Av Efficiency"], horizontal=True)
+
+    if start_date > end_date:
+        st.error("Start date cannot be after end date.")
+        return
 
-# ✅ Function to Fetch Data from PostgreSQL
-def get_data(query, params=None):
     try:
-        with engine.connect() as conn:
-            df = pd.read_sql(text(query), conn, params=params)
-        return df
+        trend = get_trend(start_date, end_date, TREND_GRAINS[grain_label],
+                          None if shift == "All" else shift, int(top_n) or None)
     except Exception as e:
         st.error(f"❌ Database connection failed: {e}")
-        return pd.DataFrame()
-
-# ✅ SQL Query to Fetch Production Data with Total Batch Output
-query_production = """
-    SELECT 
-        "Machine", 
-        "batch number",  
-        a."Product" AS "Product",  
-        SUM("quantity") AS "Produced Quantity",
-        SUM(SUM("quantity")) OVER (PARTITION BY "Machine", "batch number") AS "Total Batch Output"
-    FROM archive a
-    WHERE "Activity" = 'Production' AND "Date" = :date AND "Day/Night/plan" = :shift
-    GROUP BY "Machine", "batch number", a."Product"
-    ORDER BY "Machine", "batch number";
-"""
-def calculate_total_batch_output(date):
-    query = """
-        SELECT 
-            "Machine", 
-            SUM("quantity") AS "Total Batch Output"
-        FROM archive
-        WHERE "Activity" = 'Production' AND "Date" = :date
-        GROUP BY "Machine"
-    """
-    return get_data(query, {"date": date})
-
-# ✅ Function to Create PDF Report
-def create_pdf(df_av, df_archive, df_production, fig):
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-
-    # ✅ Set PDF Title
-    c.setTitle("Machine Performance Report")
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(50, 750, "📊 Machine Performance Report")
-
-    # ✅ Convert Plotly graph to high-quality PNG
-    img_buf = io.BytesIO()
-    pio.write_image(fig, img_buf, format="png", scale=3)
-    img_buf.seek(0)
-    img = ImageReader(img_buf)
-    c.drawImage(img, 50, 500, width=500, height=200)
-
-    # ✅ Add tables
-    add_table(c, "📋 Machine Activity Summary", df_archive, 450)
-    add_table(c, "🏭 Production Summary", df_production, 300)
-    add_table(c, "📈 AV Data", df_av, 150)
-
-    # ✅ Save PDF
-    c.save()
-    buffer.seek(0)
-
-    return buffer.getvalue()
-def generate_full_html():
-    fig_html = fig.to_html(full_html=False) if not df_av.empty else ""
-
-    raw_html = f"""
-    <html>
-    <head>
-        <title>Machine Performance Report</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; padding: 20px; }}
-            table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-            th, td {{ border: 1px solid black; padding: 8px; text-align: left; }}
-            th {{ background-color: #f2f2f2; }}
-            .graph-container {{ text-align: center; margin: 20px 0; }}
-        </style>
-    </head>
-    <body>
-        <h1>📊 Machine Performance Report</h1>
-        <div class="graph-container">{fig_html}</div>
-        <h2>📋 Machine Activity Summary</h2>
-        {df_archive.to_html(index=False)}
-        <h2>🏭 Production Summary</h2>
-        {df_production.to_html(index=False)}
-        <h2>📈 AV Data</h2>
-        {df_av.to_html(index=False)}
-    </body>
-    </html>
-    """
-
-    # Minify and clean HTML using BeautifulSoup
-    soup = BeautifulSoup(raw_html, "html.parser")
-    return soup.prettify(formatter="minimal")
+        return
+
+    if trend.empty:
+        st.warning("⚠️ No AV data available for the selected range.")
+        return
+
+    st.subheader(f"📈 {grain_label} {metric} per Machine")
+    st.plotly_chart(px.line(trend, x="period", y=metric, color="machine", markers=True))
+    st.subheader("🔻 Machines Ranked by OEE")
+    st.dataframe(worst_machines(trend))
+
+def show_branch_errors(errors):
+    for failed_branch, error in sorted(errors.items()):
+        st.warning(f"⚠️ {failed_branch}: {error} (left out of the totals)")
+
+
+def render_plant_view():
+    """Plant-wide OEE: the same queries fanned out concurrently to every branch database."""
+    mode = st.radio("Scope", ["Shift", "Date Range"], horizontal=True)
+    if mode == "Shift":
+        col1, col2 = st.columns(2)
+        date = col1.date_input("📅 Select Date")
+        shift = col2.selectbox("🕒 Select Shift Type", ["Day", "Night", "Plan"])
+        plant_av, errors = get_plant_av(date, shift)
+        show_branch_errors(errors)
+        if plant_av.empty:
+            st.warning("⚠️ No AV data available in any branch for the selected filters.")
+            return
+        st.subheader("🏢 OEE per Branch")
+        st.dataframe(plant_summary(plant_av))
+        st.plotly_chart(px.bar(plant_av, x="machine", y="OEE", color="branch", barmode="group",
+                               title="OEE per Machine and Branch"))
+        st.subheader("📈 AV Data, All Branches")
+        st.dataframe(plant_av)
+        return
+
+    today = datetime.date.today()
+    col1, col2, col3 = st.columns(3)
+    start_date = col1.date_input("📅 Start Date", value=today - datetime.timedelta(days=30))
+    end_date = col2.date_input("📅 End Date", value=today)
+    grain_label = col3.selectbox("Rollup", list(TREND_GRAINS), index=1)
+    if start_date > end_date:
+        st.error("Start date cannot be after end date.")
+        return
+    trend, errors = get_plant_trend(start_date, end_date, TREND_GRAINS[grain_label])
+    show_branch_errors(errors)
+    if trend.empty:
+        st.warning("⚠️ No AV data available in any branch for the selected range.")
+        return
+    branch_trend = trend.groupby(["period", "branch"], as_index=False)["OEE"].mean()
+    st.subheader(f"📈 {grain_label} OEE per Branch")
+    st.plotly_chart(px.line(branch_trend, x="period", y="OEE", color="branch", markers=True))
+    st.dataframe(branch_trend.pivot(index="period", columns="branch", values="OEE"))
+
 # ✅ Streamlit UI
 st.title("📊 Machine Performance Dashboard")
 
+view_modes = ["Shift Snapshot", "Date Range Trend"]
+if "cross_branch" in ROLE_ACCESS.get(st.session_state.get("role"), []):
+    view_modes.append("All Branches")
+view_mode = st.radio("View", view_modes, horizontal=True)
+if view_mode == "Date Range Trend":
+    render_trend_view()
+    st.stop()
+if view_mode == "All Branches":
+    render_plant_view()
+    st.stop()
+
 # ✅ User Inputs
 date_selected = st.date_input("📅 Select Date")
 shift_selected = st.selectbox("🕒 Select Shift Type", ["Day", "Night", "Plan"])
 
 # ✅ Fetch Data
-query_av = """
-    SELECT "machine", "Availability", "Av Efficiency", "OEE"
-    FROM av
-    WHERE "date" = :date AND "shift" = :shift
-"""
-query_archive = """
-    SELECT "Machine", "Activity", SUM("time") as "Total_Time", AVG("efficiency") as "Avg_Efficiency"
-    FROM archive
-    WHERE "Date" = :date AND "Day/Night/plan" = :shift
-    GROUP BY "Machine", "Activity"
-"""
-
-df_av = get_data(query_av, {"date": date_selected, "shift": shift_selected})
-df_archive = get_data(query_archive, {"date": date_selected, "shift": shift_selected})
-df_production = get_data(query_production, {"date": date_selected, "shift": shift_selected})
-df_total_output = calculate_total_batch_output(date_selected)  # ✅ Pass only the date
-
-# Merge the total batch output data
-df_production = df_production.merge(df_total_output, on="Machine", how="left")
-
-# Drop the duplicate column and rename correctly
-df_production["Total Batch Output"] = df_production["Total Batch Output_y"]
-df_production.drop(columns=["Total Batch Output_x", "Total Batch Output_y"], inplace=True)
-
-
+df_av, df_archive, df_production = get_data(date_selected, shift_selected)
 
 # ✅ Generate Graph
+fig = None
 if not df_av.empty:
     st.subheader("📈 Machine Efficiency, Availability & OEE")
     fig = px.bar(df_av, x="machine", y=["Availability", "Av Efficiency", "OEE"], 
@@ -171,22 +143,40 @@ st.dataframe(df_archive)
 st.subheader("🏭 Production Summary per Machine and Batch")
 st.dataframe(df_production)
 
-# ✅ PDF Download Button
+# ✅ PDF Download Button (rendered in the background, cached per data version)
+branch = st.session_state.get("branch", "main")
 if st.button("📥 Download Full Report as PDF"):
-    pdf_report = create_pdf(df_av, df_archive, df_production, fig)
-    file_name = f"{shift_selected}_{date_selected}.pdf"
-
-    st.download_button(label="📥 Click here to download", 
-                       data=pdf_report, 
-                       file_name=file_name, 
-                       mime="application/pdf")
-
-
-html_bytes = generate_full_html().encode("utf-8")
-html_file = f"{shift_selected}_{date_selected}.html"
-
-# ✅ HTML Download Button
-st.download_button(label="📥 Download Full Page as HTML", 
-                   data=html_bytes, 
-                   file_name=html_file, 
-                   mime="text/html")
+    st.session_state.pdf_job = render_pdf_async(
+        branch, date_selected, shift_selected, df_av, df_archive, df_production, fig
+    )
+
+pdf_job = st.session_state.get("pdf_job")
+if pdf_job is not None and pdf_job.key[:3] == (branch, str(date_selected), shift_selected):
+    if not pdf_job.done():
+        st.progress(pdf_job.progress, text=f"⏳ {pdf_job.stage}")
+        time.sleep(0.5)
+        st.rerun()
+    elif pdf_job.future.exception() is not None:
+        st.error(f"❌ PDF generation failed: {pdf_job.future.exception()}")
+        st.session_state.pop("pdf_job", None)
+    else:
+        st.download_button(label="📥 Click here to download", 
+                           data=pdf_job.result(), 
+                           file_name=f"{shift_selected}_{date_selected}.pdf", 
+                           mime="application/pdf")
+
+# ✅ HTML export is only built when requested, then cached per data version
+if st.button("📄 Prepare Full Page as HTML"):
+    st.session_state.html_export_key = (branch, str(date_selected), shift_selected)
+
+if st.session_state.get("html_export_key") == (branch, str(date_selected), shift_selected):
+    html_bytes, render_ms, from_cache = render_html(
+        branch, date_selected, shift_selected, df_av, df_archive, df_production, fig
+    )
+    st.caption("⚡ Served from cache" if from_cache else f"⏱️ Rendered in {render_ms:.0f} ms")
+
+    # ✅ HTML Download Button
+    st.download_button(label="📥 Download Full Page as HTML", 
+                       data=html_bytes, 
+                       file_name=f"{shift_selected}_{date_selected}.html", 
+                       mime="text/html")
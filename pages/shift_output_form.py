@@ -3,13 +3,13 @@ import datetime
 import pandas as pd
 import csv
 import os
-from db import get_sqlalchemy_engine
-from sqlalchemy.sql import text  # Import SQL text wrapper
+from shifts import get_shift_definitions
+from dashboard_data import invalidate_dashboard
+from shift_store import ShiftReportExistsError, save_shift_report, shift_report_exists
+from shift_records import BatchEntry, DowntimeEntry, ShiftKey, PARTIAL_SHIFT_CODE, PARTIAL_SHIFT_MAX_HOURS, compute_shift_record, validate_shift_totals
+from master_cache import get_machine_names, get_product_names, resolve_standard_rates
 import plotly.graph_objects as go
 import matplotlib.pyplot as plt
-from db import get_db_connection
-import psycopg2
-import bcrypt
 from auth import check_authentication, check_access
 # Hide Streamlit's menu and "Manage app" button
 st.markdown("""
@@ -26,9 +26,6 @@ check_authentication()
 # Enforce access control: Only "user", "power user", and "admin" can access this form
 check_access(["user", "power user", "admin"])
 
-# Get the correct database engine for the assigned branch
-engine = get_sqlalchemy_engine()
-
 def reset_form():
     """Fully resets all form inputs, including downtime and batch entries, without logging out the user."""
     
@@ -62,74 +59,51 @@ def reset_form():
     st.toast("🔄 Form reset successfully!")
     st.rerun()  # ✅ Force UI refresh to clear inputs
     
-def save_to_database(archive_df, av_df):
-    """Saves archive and av dataframes to PostgreSQL using SQLAlchemy."""
-    engine = get_sqlalchemy_engine()
-
-    if engine is None:
-        st.error("❌ Database connection failed. Please check credentials.")
-        return
-
+def save_to_database(shift_key, archive_df, av_df, replace=False):
+    """Saves (or atomically replaces) a shift report in one transaction; returns True on success."""
     try:
-        # ✅ Convert all numeric columns before inserting into DB
-        numeric_cols_archive = ["time", "efficiency", "quantity", "rate", "standard rate"]
-        numeric_cols_av = ["hours", "T.production time", "Availability", "Av Efficiency", "OEE"]
-
-        for col in numeric_cols_archive:
-            if col in archive_df.columns:
-                archive_df[col] = pd.to_numeric(archive_df[col], errors="coerce")
+        save_seconds = save_shift_report(shift_key, archive_df, av_df, replace=replace)
+    except ShiftReportExistsError:
+        st.error("❌ A report for this Date, Shift Type, and Machine already exists. Modify your selection or delete existing data before saving.")
+        return False
+    except Exception as e:
+        st.error(f"❌ Critical error while saving: {e}")
+        return False
 
-        for col in numeric_cols_av:
-            if col in av_df.columns:
-                av_df[col] = pd.to_numeric(av_df[col], errors="coerce")
+    invalidate_dashboard(shift_key.date)  # ✅ Dashboard shows the new report immediately
+    print(f"✅ Shift report saved in {save_seconds * 1000:.0f} ms ({len(archive_df)} archive rows)")
+    st.toast(f"✅ Data saved to database successfully! ({save_seconds * 1000:.0f} ms)")
+    return True
 
-        # ✅ Debugging: Print Data Types Before Saving
-        st.write("DEBUG: Archive Data Types Before Saving", archive_df.dtypes)
-        st.write("DEBUG: AV Data Types Before Saving", av_df.dtypes)
+def get_standard_rates(products, machine):
+    """Return {product: standard rate} for a machine from the cached rate matrix.
 
-        # ✅ Save data using SQLAlchemy (handles data types automatically)
-        archive_df.to_sql("archive", engine, if_exists="append", index=False)
-        av_df.to_sql("av", engine, if_exists="append", index=False)
+    Products without a usable rate default to 1 (to avoid division by zero) and
+    are reported together in a single warning.
+    """
+    try:
+        rates, missing, invalid = resolve_standard_rates(products, machine)
+    except Exception as e:
+        st.error(f"❌ Database error: {e}")
+        rates, missing, invalid = {}, list(products), []
 
-        st.success("✅ Data saved to database successfully!")
+    if invalid:
+        st.error(f"⚠️ Invalid standard_rate found on {machine} for: {', '.join(invalid)}. Using 1 as default.")
+    if missing:
+        st.warning(f"⚠️ No standard rate found on {machine} for: {', '.join(missing)}. Using 1 as default.")
 
-    except Exception as e:
-        st.error(f"❌ Critical error while saving: {e}")
-def get_standard_rate(product, machine):
-    query = text("""
-        SELECT standard_rate FROM rates 
-        WHERE product = :product AND machine = :machine
-        LIMIT 1
-    """)
-
-    with engine.connect() as conn:
-        result = conn.execute(query, {"product": product, "machine": machine}).fetchone()
-
-    if result and result[0] is not None:
-        try:
-            return float(result[0])  # Ensure it's a valid float
-        except ValueError:
-            st.error(f"⚠️ Invalid standard_rate found for {product} - {machine}: {result[0]}")
-            return 1  # Default to 1 to avoid division by zero
-    else:
-        st.warning(f"⚠️ No standard rate found for {product} - {machine}. Using 1 as default.")
-        return 1  # Default to 1 to prevent division errors
-# Function to fetch data from PostgreSQL
-def fetch_data(query):
-    """Fetch data from PostgreSQL and return as a list."""
+    return {product: rates.get(product, 1) for product in products}
+# Function to fetch master data from the shared cache
+def fetch_master_lists():
+    """Return (machine names, product names) from the branch master-data cache."""
     try:
-        with engine.connect() as conn:
-            df = pd.read_sql(query, conn)
-        return df["name"].tolist()
+        return get_machine_names(), get_product_names()
     except Exception as e:
         st.error(f"❌ Database error: {e}")
-        return []
-
-# Fetch machine list from database
-machine_list = fetch_data("SELECT name FROM machines")
+        return [], []
 
-# Fetch product list from database
-product_list = fetch_data("SELECT name FROM products")
+# Fetch machine and product lists (cached per branch, no query per widget change)
+machine_list, product_list = fetch_master_lists()
 
 # Check if product_list is empty
 if not product_list:
@@ -165,23 +139,25 @@ if "modify_mode" not in st.session_state:
 if st.button("Restart App"):
     reset_form()
     st.rerun()  # ✅ Force rerun to apply changes
+shift_durations = []
+shift_hours = {}
 # Check if product_list is empty
 if not product_list:
     st.error("Product list is empty. Please check products.csv.")
 else:
-    # Read shift types from shifts.csv
+    # Shift definitions are parsed once and only re-read when shifts.csv changes
     try:
-        shifts_df = pd.read_csv("shifts.csv")
-        shift_durations = shifts_df["code"].tolist()
-        shift_working_hours = shifts_df["working hours"].tolist()
+        shift_definitions = get_shift_definitions()
+        shift_durations = list(shift_definitions.codes)
+        shift_hours = shift_definitions.hours
     except FileNotFoundError:
         st.error("shifts.csv file not found. Please create the file.")
         shift_durations = []
-        shift_working_hours = []
+        shift_hours = {}
     except Exception as e:
         st.error(f"An error occurred reading shifts.csv: {e}")
         shift_durations = []
-        shift_working_hours = []
+        shift_hours = {}
 # Step 1: User selects Date, Machine, and Shift Type
 st.subheader("Step 1: Select Shift Details")
 shift_types = ["Day", "Night", "Plan"]
@@ -191,63 +167,30 @@ shift_type = st.selectbox("Shift Type", [""] + shift_types, index=0, key="shift_
 if st.button("Proceed"):
     st.session_state.proceed_clicked = True
     st.rerun()
+shift_key = ShiftKey(date, selected_machine, shift_type)
 if st.session_state.get("proceed_clicked", False):
-    # Query to check if a record exists in 'av' table
-    query = text("""
-        SELECT COUNT(*) FROM av 
-        WHERE date = :date AND shift = :shift AND machine = :machine
-    """)
-
-    with engine.connect() as conn:
-        result = conn.execute(query, {"date": date, "shift": shift_type, "machine": selected_machine}).fetchone()
+    # Cheap EXISTS probe on av/archive; no rows are fetched
+    try:
+        report_exists = shift_report_exists(shift_key)
+    except Exception as e:
+        st.error(f"❌ Database error: {e}")
+        report_exists = False
 
-    if result and result[0] > 0:  # If a record already exists
+    if report_exists and st.session_state.get("replace_data") == shift_key:
+        st.info("♻️ The existing report will be replaced when you Approve and Save.")
+    elif report_exists:
         st.warning("⚠️ A report for this Date, Shift Type, and Machine already exists. Choose an action.")
 
-    col1, col2 = st.columns(2)
-    if col1.button("🗑️ Delete Existing Data and Proceed"):
-        try:
-            with engine.begin() as conn:  # Use engine.begin() to keep connection open
-            # Check if records exist before deleting
-                check_query_av = text("""
-                    SELECT * FROM av WHERE date = :date AND shift = :shift AND machine = :machine
-                """)
-                result_av = conn.execute(check_query_av, {"date": date, "shift": shift_type, "machine": selected_machine}).fetchall()
-
-                check_query_archive = text("""
-                    SELECT * FROM archive WHERE "Date" = :date AND "Machine" = :machine AND "Day/Night/plan" = :shift
-                """)
-                result_archive = conn.execute(check_query_archive, {"date": date, "shift": shift_type, "machine": selected_machine}).fetchall()
-
-                # Show records before deletion
-                if not result_av and not result_archive:
-                    st.warning("⚠️ No matching records found. Nothing to delete.")
-                else:
-                    st.write("🔍 Records found in 'av':", result_av)
-                    st.write("🔍 Records found in 'archive':", result_archive)
-
-                    # Proceed with deletion if records exist
-                    delete_query_av = text("""
-                        DELETE FROM av WHERE date = :date AND shift = :shift AND machine = :machine
-                    """)
-                    conn.execute(delete_query_av, {"date": date, "shift": shift_type, "machine": selected_machine})
-
-                    delete_query_archive = text("""
-                        DELETE FROM archive WHERE "Date" = :date AND "Machine" = :machine AND "Day/Night/plan" = :shift
-                    """)
-                    conn.execute(delete_query_archive, {"date": date, "shift": shift_type, "machine": selected_machine})
-
-                    st.success("✅ Existing records deleted. You can proceed with new data entry.")
-                    st.session_state.proceed_clicked = False  # Reset proceed state
-
-        except Exception as e:
-            st.error(f"❌ Error deleting records: {e}")
-
-    if col2.button("🔄 Change Selection"):
+        col1, col2 = st.columns(2)
+        if col1.button("🗑️ Delete Existing Data and Proceed"):
+            # ✅ Old rows are deleted in the same transaction as the new insert
+            st.session_state.replace_data = shift_key
+            st.rerun()
+
+        if col2.button("🔄 Change Selection"):
             st.warning("🔄 Please modify the Date, Shift Type, or Machine to proceed.")
             st.session_state.proceed_clicked = False  # Reset proceed state
             st.stop()  # Prevents further execution
-
     else:
         st.success("✅ No existing record found. You can proceed with the form.")
     
@@ -336,7 +279,6 @@ for product, batch_list in st.session_state.product_batches.items():
 
 
 
-from sqlalchemy.sql import text  # Import SQL text wrapper
 
 # Ensure session state variables exist
 if "show_confirmation" not in st.session_state:
@@ -349,9 +291,6 @@ if "submitted" not in st.session_state:
     st.session_state.submitted = False  # Tracks if report is submitted
 
 # Function to update session state safely
-def set_replace_data():
-    st.session_state.replace_data = True
-
 def set_restart_form():
     st.session_state.restart_form = True
 
@@ -368,98 +307,33 @@ else:
           
 
  
-    # Construct archive_df (Downtime records)
-archive_data = []
-for dt_type in downtime_types:
-    if downtime_data[dt_type] > 0:
-        archive_row = {
-            "Date": date,
-            "Machine": selected_machine,
-            "Day/Night/plan": shift_type,
-            "Activity": dt_type,
-            "time": downtime_data[dt_type],
-            "Product": "",
-            "batch number": "",
-            "quantity": "",
-            "comments": downtime_data[dt_type + "_comment"],
-            "rate": "",
-            "standard rate": "",
-            "efficiency": "",
-        }
-        archive_data.append(archive_row)  # Append to the list
-
-# Construct archive_df (Production batch records)
-# ✅ Initialize average_efficiency with a default value
-average_efficiency = 0  # Default to 0 if no efficiency data is available
-# ✅ Always initialize production_data before using it
-production_data = []
-efficiencies = []  # Declare only once
-
-if "product_batches" in st.session_state and st.session_state["product_batches"]:
-    for product, batch_list in st.session_state["product_batches"].items():
-        for batch in batch_list:
-            rate = batch["quantity"] / batch["time_consumed"] if batch["time_consumed"] != 0 else 0
-            standard_rate = get_standard_rate(product, selected_machine) or 1  # Avoid division by zero
-            efficiency = rate / standard_rate
-            efficiencies.append(efficiency)
-            # ✅ Ensure efficiency calculation runs even if no products are added
-            if efficiencies:
-                average_efficiency = sum(efficiencies) / len(efficiencies)
-                production_data.append({
-                    "Date": date,
-                    "Machine": selected_machine,
-                    "Day/Night/plan": shift_type,
-                    "Activity": "Production",
-                    "time": batch["time_consumed"],
-                    "Product": product,
-                    "batch number": batch["batch"],
-                    "quantity": batch["quantity"],
-                    "comments": "",
-                    "rate": rate,
-                    "standard rate": standard_rate,
-                    "efficiency": efficiency,
-                })
-
-
-# ✅ Merge both downtime and production records
-archive_data.extend(production_data)
-
-# ✅ Create DataFrame from the combined list
-archive_df = pd.DataFrame(archive_data)
-
-            # Construct av_df
-total_production_time = sum(
-    batch["time_consumed"] for product, batch_list in st.session_state.product_batches.items() for batch in batch_list
-)
-
-filtered_shift = shifts_df.loc[shifts_df['code'] == shift_duration, 'working hours']
-
-if not filtered_shift.empty:
-    standard_shift_time = filtered_shift.iloc[0]
-else:
+# ✅ Build archive/av rows in one pass with the UI-free engine
+standard_shift_time = shift_hours.get(shift_duration)
+if standard_shift_time is None and shift_duration != PARTIAL_SHIFT_CODE:
     st.error(f"⚠️ Shift duration '{shift_duration}' not found in shifts.csv.")
-    standard_shift_time = None  # Set default value or handle gracefully
 
-
-if shift_duration == "partial":
-    total_downtime = sum(downtime_data.values()) - sum(1 for key in downtime_data if "_comment" in key)
-    availability = total_production_time / (total_production_time + total_downtime) if (total_production_time + total_downtime) != 0 else 0
-else:
-    availability = total_production_time / standard_shift_time if standard_shift_time != 0 else 0
-
-OEE = 0.99 * availability * average_efficiency
-av_row = {
-                    "date": date,
-                    "machine": selected_machine,
-                    "shift type": shift_duration,
-                    "hours": standard_shift_time,
-                    "shift": shift_type,
-                    "T.production time": total_production_time,
-                    "Availability": availability,
-                    "Av Efficiency": average_efficiency,
-                    "OEE": OEE,
-}
-av_df = pd.DataFrame([av_row])
+downtime_entries = [
+    DowntimeEntry(dt_type, downtime_data[dt_type], downtime_data.get(f"{dt_type}_comment", ""))
+    for dt_type in downtime_types
+]
+batch_entries = [
+    BatchEntry(product, batch["batch"], batch["quantity"], batch["time_consumed"])
+    for product, batch_list in st.session_state.product_batches.items()
+    for batch in batch_list
+]
+# ✅ One in-memory lookup per rerun instead of one query per batch
+standard_rates = get_standard_rates(sorted({entry.product for entry in batch_entries}), selected_machine) if batch_entries else {}
+
+shift_record = compute_shift_record(
+    shift_key,
+    downtime_entries,
+    batch_entries,
+    shift_duration,
+    standard_shift_time,
+    standard_rates,
+)
+archive_df = pd.DataFrame(shift_record.archive_rows)
+av_df = pd.DataFrame([shift_record.av_row])
 
 # Store submitted data in session state
 st.session_state.submitted_archive_df = archive_df
@@ -470,31 +344,15 @@ st.subheader("Submitted Archive Data")
 st.dataframe(st.session_state.submitted_archive_df)
 st.subheader("Submitted AV Data")
 st.dataframe(st.session_state.submitted_av_df)
-           # Compute total recorded time (downtime + production time)
-total_production_time = sum(
-    batch["time_consumed"] for product, batch_list in st.session_state.product_batches.items() for batch in batch_list
-)
-total_downtime = sum(downtime_data[dt] for dt in downtime_types)
-total_recorded_time = total_production_time + total_downtime
-
-# Fetch standard shift time
-try:
-    if shift_duration == "partial":
-        standard_shift_time = None  # No standard time for partial shift
-    else:
-        standard_shift_time = shifts_df.loc[shifts_df['code'] == shift_duration, 'working hours'].iloc[0]
-except IndexError:
-    st.error("Shift duration not found in shifts.csv")
-    standard_shift_time = 0  # Default to 0 to avoid None issues
 
-# Compute total recorded time (downtime + production time)
-total_production_time = sum(batch["time_consumed"] for batch in st.session_state.product_batches[selected_product])
-total_downtime = sum(downtime_data[dt] for dt in downtime_types)
-total_recorded_time = archive_df["time"].sum()
+# Total recorded time (downtime + production time); no standard time for partial shifts
+total_recorded_time = shift_record.total_recorded_time
+if shift_duration == PARTIAL_SHIFT_CODE:
+    standard_shift_time = None
 
 # Special check for "partial" shift
-if shift_duration == "partial":
-    if total_recorded_time > 7:
+if shift_duration == PARTIAL_SHIFT_CODE:
+    if total_recorded_time > PARTIAL_SHIFT_MAX_HOURS:
         st.error("⚠️ Total recorded time cannot exceed 7 hours for a partial shift!")
     st.warning("⏳ Shift visualization is not available for 'partial' shifts.")
 else:
@@ -539,54 +397,25 @@ else:
     
 if st.button("Approve and Save"):
     try:
-        # Check for duplicate entries in both "av" and "archive" tables
-        query_av = text("""
-            SELECT COUNT(*) FROM av 
-            WHERE date = :date AND "shift" = :shift AND machine = :machine
-        """)
-        query_archive = text("""
-            SELECT COUNT(*) FROM archive 
-            WHERE "Date" = :date AND "Machine" = :machine AND "Day/Night/plan" = :shift
-        """)
-
-        with engine.connect() as conn:
-            result_av = conn.execute(query_av, {"date": date, "shift": shift_type, "machine": selected_machine}).fetchone()
-            result_archive = conn.execute(query_archive, {"date": date, "shift": shift_type, "machine": selected_machine}).fetchone()
-
-        # If a duplicate exists in either table, STOP execution completely
-        if (result_av and result_av[0] > 0) or (result_archive and result_archive[0] > 0):
-            st.error("❌ A report for this Date, Shift Type, and Machine already exists. Modify your selection or delete existing data before saving.")
-            st.stop()  # ⛔ Completely stop execution
+        # Clean DataFrames before using them
+        archive_df = clean_dataframe(st.session_state.submitted_archive_df.copy())
+        av_df = clean_dataframe(st.session_state.submitted_av_df.copy())
+
+        # Validation checks (shared with the bulk importer)
+        validation_error = validate_shift_totals(
+            shift_duration,
+            archive_df["time"].sum(),
+            archive_df["efficiency"].max(),
+            shift_hours.get(shift_duration),
+        )
 
+        if validation_error:
+            st.error(validation_error)
         else:
-            st.success("No existing record found. Proceeding with approval.")
-
-            # Clean DataFrames before using them
-            archive_df = clean_dataframe(st.session_state.submitted_archive_df.copy())
-            av_df = clean_dataframe(st.session_state.submitted_av_df.copy())
-
-            # Get shift standard time
-            standard_shift_time = shifts_df.loc[shifts_df['code'] == shift_duration, 'working hours'].iloc[0]
-
-            # Validation checks
-            total_recorded_time = archive_df["time"].sum()
-            efficiency_invalid = (archive_df["efficiency"] > 1).any()
-            time_exceeds_shift = total_recorded_time > standard_shift_time
-            time_below_90 = total_recorded_time < (0.9 * standard_shift_time)
-
-            if efficiency_invalid:
-                st.error("Efficiency must not exceed 1. Please review and modify the data.")
-            elif time_exceeds_shift:
-                st.error(f"Total recorded time ({total_recorded_time} hrs) exceeds shift standard time ({standard_shift_time} hrs). Modify the data.")
-            elif time_below_90:
-                st.error(f"Total recorded time ({total_recorded_time} hrs) is less than 90% of shift standard time ({0.9 * standard_shift_time} hrs). Modify the data.")
-            else:
-                # Save cleaned data to PostgreSQL
-                archive_df.to_sql("archive", engine, if_exists="append", index=False)
-                av_df.to_sql("av", engine, if_exists="append", index=False)
-                st.success("Data saved to database successfully!")
+            # Save cleaned data to PostgreSQL (both tables in one transaction)
+            replace = st.session_state.get("replace_data") == shift_key
+            if save_to_database(shift_key, archive_df, av_df, replace=replace):
                 # ✅ Reset form after successful save
                 reset_form()
-                st.rerun()  # ✅ Force rerun to apply changes
     except Exception as e:
         st.error(f"Error saving data: {e}")
@@ -1,57 +1,46 @@
 import streamlit as st
-import psycopg2
-import bcrypt
-from db import get_db_connection
+from db import pooled_connection
+from passwords import get_login_latency_stats, hash_password
+from session_tokens import revoke_user_sessions
 from auth import check_authentication, check_access
 
 def get_users():
     """Fetch all users from the database."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, username, role, branch FROM users")
-    users = cur.fetchall()
-    cur.close()
-    conn.close()
-    return users
+    with pooled_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id, username, role, branch FROM users")
+        return cur.fetchall()
 
 def add_user(username, password, role, branch):
     """Add a new user with hashed password."""
-    hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO users (username, password, role, branch) VALUES (%s, %s, %s, %s)", 
-                (username, hashed_password, role, branch))
-    conn.commit()
-    cur.close()
-    conn.close()
+    hashed_password = hash_password(password)
+    with pooled_connection() as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO users (username, password, role, branch) VALUES (%s, %s, %s, %s)", 
+                    (username, hashed_password, role, branch))
 
 def update_user(user_id, role, branch):
     """Update user's role or branch."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET role = %s, branch = %s WHERE id = %s", (role, branch, user_id))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with pooled_connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE users SET role = %s, branch = %s WHERE id = %s RETURNING username", (role, branch, user_id))
+        row = cur.fetchone()
+    if row:
+        revoke_user_sessions(row[0])  # ✅ Old tokens still carry the previous role/branch
 
 def reset_password(user_id, new_password):
     """Reset a user's password."""
-    hashed_password = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET password = %s WHERE id = %s", (hashed_password, user_id))
-    conn.commit()
-    cur.close()
-    conn.close()
+    hashed_password = hash_password(new_password)
+    with pooled_connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE users SET password = %s WHERE id = %s RETURNING username", (hashed_password, user_id))
+        row = cur.fetchone()
+    if row:
+        revoke_user_sessions(row[0])
 
 def delete_user(user_id):
     """Delete a user."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with pooled_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM users WHERE id = %s RETURNING username", (user_id,))
+        row = cur.fetchone()
+    if row:
+        revoke_user_sessions(row[0])
 
 # Check authentication and access
 check_authentication()
@@ -59,6 +48,13 @@ check_access(["admin"])
 
 st.title("User Management")
 
+# ✅ Login latency over recent logins in this process (bcrypt queueing shows up in p95)
+login_stats = get_login_latency_stats()
+st.caption(
+    f"Login latency over the last {login_stats['logins']} logins: "
+    f"p50 {login_stats['p50_ms']:.0f} ms · p95 {login_stats['p95_ms']:.0f} ms · max {login_stats['max_ms']:.0f} ms"
+)
+
 # Display users
 users = get_users()
 user_options = {str(user[0]): f"{user[1]} ({user[2]})" for user in users}
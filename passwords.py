@@ -0,0 +1,140 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+import streamlit as st
+
+# ✅ Defaults used when `[auth]` is not set in st.secrets
+PASSWORD_DEFAULTS = {
+    "bcrypt_rounds": 12,  # work factor for new hashes; older hashes are upgraded on login
+    "hash_workers": 2,  # processes hashing in parallel; more logins queue instead of starving the app
+    "hash_timeout": 30,  # seconds to wait for a queued hash
+    "max_attempts": 5,  # failed logins per username within lockout_seconds
+    "lockout_seconds": 300,
+}
+LATENCY_SAMPLES = 1000
+MAX_TRACKED_USERNAMES = 10000  # failure history kept; logins with unknown names must not grow it without bound
+
+_executor = None
+_executor_lock = threading.Lock()
+_failures = {}  # username -> deque of failure timestamps, least recently failed first
+_failures_lock = threading.Lock()
+_login_latencies = deque(maxlen=LATENCY_SAMPLES)
+
+
+def get_password_settings():
+    """Returns password settings from `st.secrets["auth"]`, falling back to PASSWORD_DEFAULTS."""
+    settings = dict(PASSWORD_DEFAULTS)
+    configured = st.secrets.get("auth", {})
+    for key in PASSWORD_DEFAULTS:
+        if key in configured:
+            settings[key] = configured[key]
+    return settings
+
+
+def _get_executor():
+    """Returns the process-wide bcrypt pool; processes keep the hashing off the script threads' GIL."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # Spawned workers: forking the multithreaded Streamlit server can deadlock
+                _executor = ProcessPoolExecutor(
+                    max_workers=get_password_settings()["hash_workers"],
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _executor
+
+
+def _run(func, *args):
+    """Runs a bcrypt call in the pool; a broken pool is dropped so the next call starts a fresh one."""
+    global _executor
+    executor = _get_executor()
+    try:
+        return executor.submit(func, *args).result(timeout=get_password_settings()["hash_timeout"])
+    except BrokenProcessPool:
+        with _executor_lock:
+            if _executor is executor:
+                _executor = None
+        raise
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def hash_password(password):
+    """Hashes a password with the configured work factor in the bcrypt process pool."""
+    return _run(_hashpw, password.encode(), get_password_settings()["bcrypt_rounds"]).decode()
+
+
+def verify_password(password, hashed):
+    """Checks a password against a stored bcrypt hash in the bcrypt process pool."""
+    return _run(_checkpw, password.encode(), hashed.strip().encode())
+
+
+def needs_rehash(hashed):
+    """True if a stored hash uses a different work factor than the configured one."""
+    try:
+        rounds = int(hashed.strip().split("$")[2])
+    except (IndexError, ValueError):
+        return True
+    return rounds != get_password_settings()["bcrypt_rounds"]
+
+
+def login_retry_after(username):
+    """Returns the seconds until ``username`` may try again, or 0 if it is not throttled."""
+    settings = get_password_settings()
+    now = time.time()
+    with _failures_lock:
+        failures = _failures.get(username)
+        if not failures:
+            return 0
+        while failures and now - failures[0] > settings["lockout_seconds"]:
+            failures.popleft()
+        if len(failures) < settings["max_attempts"]:
+            return 0
+        return int(settings["lockout_seconds"] - (now - failures[0])) + 1
+
+
+def record_login_failure(username):
+    """Records a failed login; past MAX_TRACKED_USERNAMES, stale and then least recent entries are dropped."""
+    settings = get_password_settings()
+    now = time.time()
+    with _failures_lock:
+        failures = _failures.pop(username, None) or deque(maxlen=settings["max_attempts"])
+        failures.append(now)
+        _failures[username] = failures
+        if len(_failures) > MAX_TRACKED_USERNAMES:
+            for name in [name for name, f in _failures.items() if now - f[-1] > settings["lockout_seconds"]]:
+                del _failures[name]
+            while len(_failures) > MAX_TRACKED_USERNAMES:
+                del _failures[next(iter(_failures))]
+
+
+def reset_login_failures(username):
+    with _failures_lock:
+        _failures.pop(username, None)
+
+
+def record_login_latency(seconds):
+    _login_latencies.append(seconds)
+
+
+def get_login_latency_stats():
+    """Returns count, p50, p95 and max login latency (ms) over the last LATENCY_SAMPLES logins."""
+    samples = sorted(_login_latencies)
+    if not samples:
+        return {"logins": 0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+
+    return {"logins": len(samples), "p50_ms": percentile(0.50), "p95_ms": percentile(0.95), "max_ms": samples[-1] * 1000}
@@ -0,0 +1,225 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+import psycopg2.extensions
+from sqlalchemy import event
+import streamlit as st
+
+# ✅ Queries slower than this are printed and kept in the slow-query log;
+# override with `[database] slow_query_ms` in st.secrets
+SLOW_QUERY_MS = 500
+SAMPLE_WINDOW = 5000  # most recent queries kept for the rolling histogram
+SLOW_LOG_SIZE = 200
+HISTOGRAM_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf")]
+
+QuerySample = namedtuple(
+    "QuerySample", ["at", "page", "branch", "statement", "ms", "rows", "pool_wait_ms", "error"]
+)
+
+_samples = deque(maxlen=SAMPLE_WINDOW)
+_slow_queries = deque(maxlen=SLOW_LOG_SIZE)
+_samples_lock = threading.Lock()
+_local = threading.local()  # per-thread pool wait and "inside a SQLAlchemy execute" flag
+
+# Liveness pings (SQLAlchemy pool_pre_ping, PgConnectionPool health check) are not page queries;
+# skipping them also leaves the checkout's pool wait for the first real statement
+PING_STATEMENTS = {"select 1", "select 1;"}
+
+# execute_values sends the rows inlined after VALUES; only the statement shape is kept
+_VALUES_PAYLOAD = re.compile(r"\bVALUES\s*\(.*", re.IGNORECASE | re.DOTALL)
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_PAGES_DIR = os.path.join(_APP_DIR, "pages")
+
+
+def get_slow_query_ms():
+    try:
+        return float(st.secrets["database"].get("slow_query_ms", SLOW_QUERY_MS))
+    except Exception:
+        return SLOW_QUERY_MS
+
+
+def _calling_page():
+    """Names the page (or top-level script) whose code issued the query."""
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_PAGES_DIR + os.sep):
+            return "pages/" + os.path.basename(filename)
+        if os.path.dirname(filename) == _APP_DIR and fallback is None:
+            fallback = os.path.basename(filename)
+        frame = frame.f_back
+    # Not under a page: the outermost repo module (e.g. batch_reports.py) or a worker thread
+    return fallback or threading.current_thread().name
+
+
+def note_pool_wait(seconds):
+    """Called by the pools after a checkout; charged to the next query on this thread."""
+    _local.pool_wait = seconds
+
+
+def statement_text(statement):
+    """Returns a statement as one whitespace-collapsed line, decoded from bytes and without row data."""
+    text = statement.decode(errors="replace") if isinstance(statement, bytes) else str(statement)
+    return " ".join(_VALUES_PAYLOAD.sub("VALUES (…)", text).split())
+
+
+def record_query(branch, statement, seconds, rows, error=False, page=None):
+    pool_wait = getattr(_local, "pool_wait", 0.0)
+    _local.pool_wait = 0.0
+    sample = QuerySample(
+        time.time(), page or _calling_page(), branch, statement_text(statement)[:500],
+        seconds * 1000, rows if rows is not None and rows >= 0 else None, pool_wait * 1000, error,
+    )
+    slow = sample.ms >= get_slow_query_ms()
+    with _samples_lock:
+        _samples.append(sample)
+        if slow:
+            _slow_queries.append(sample)
+    if slow:
+        print(f"🐢 Slow query ({sample.ms:.0f} ms, {sample.rows} rows) on {branch} from {sample.page}: {sample.statement[:200]}")
+
+
+def is_ping(statement):
+    # Length check first: execute_values statements can be megabytes
+    return isinstance(statement, (str, bytes)) and len(statement) < 32 and statement_text(statement).lower() in PING_STATEMENTS
+
+
+# --- SQLAlchemy engines -------------------------------------------------------
+
+def instrument_engine(engine, branch):
+    """Times every statement an engine executes via SQLAlchemy cursor events."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        _local.in_sqlalchemy = True
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        _local.in_sqlalchemy = False
+        started = conn.info["query_start"].pop()
+        record_query(branch, statement, time.perf_counter() - started, cursor.rowcount)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        _local.in_sqlalchemy = False
+        conn = exception_context.connection
+        starts = conn.info.get("query_start") if conn is not None else None
+        seconds = time.perf_counter() - starts.pop() if starts else 0.0
+        record_query(branch, exception_context.statement or "", seconds, None, error=True)
+
+    return engine
+
+
+# --- psycopg2 connections -----------------------------------------------------
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """psycopg2 cursor that records execute/executemany/copy_expert timings.
+
+    Statements already timed by SQLAlchemy's events and liveness pings are skipped,
+    so engines and psycopg2 pools can share it without double counting.
+    """
+
+    def _timed(self, method, statement, *args, **kwargs):
+        if getattr(_local, "in_sqlalchemy", False) or is_ping(statement):
+            return method(statement, *args, **kwargs)
+        branch = getattr(self.connection, "branch", None) or self.connection.info.host
+        started = time.perf_counter()
+        try:
+            result = method(statement, *args, **kwargs)
+        except Exception:
+            record_query(branch, statement, time.perf_counter() - started, None, error=True)
+            raise
+        record_query(branch, statement, time.perf_counter() - started, self.rowcount)
+        return result
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(super().copy_expert, sql, file, size)
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose cursors are InstrumentedCursor and that knows its branch."""
+
+    branch = None
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault("cursor_factory", InstrumentedCursor)
+        return super().cursor(*args, **kwargs)
+
+
+def instrumented_connection_factory(branch):
+    """Returns a connection_factory for psycopg2.connect() tagging connections with ``branch``."""
+    return type("InstrumentedConnection", (InstrumentedConnection,), {"branch": branch})
+
+
+# --- Reporting ------------------------------------------------------------------
+
+def get_samples():
+    with _samples_lock:
+        return list(_samples)
+
+
+def get_slow_queries():
+    with _samples_lock:
+        return list(reversed(_slow_queries))
+
+
+def reset_metrics():
+    with _samples_lock:
+        _samples.clear()
+        _slow_queries.clear()
+
+
+def latency_histogram(samples=None):
+    """Returns [(bucket label, count)] of query latency over the rolling window."""
+    samples = get_samples() if samples is None else samples
+    counts = [0] * len(HISTOGRAM_BUCKETS_MS)
+    for sample in samples:
+        for i, upper in enumerate(HISTOGRAM_BUCKETS_MS):
+            if sample.ms <= upper:
+                counts[i] += 1
+                break
+    labels = [f"≤{int(upper)} ms" if upper != float("inf") else f">{int(HISTOGRAM_BUCKETS_MS[-2])} ms"
+              for upper in HISTOGRAM_BUCKETS_MS]
+    return list(zip(labels, counts))
+
+
+def _percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))] if sorted_values else 0.0
+
+
+def page_summary(samples=None):
+    """Per calling page: query count, total/p50/p95/max ms, rows fetched, pool wait, errors and slow queries."""
+    samples = get_samples() if samples is None else samples
+    slow_ms = get_slow_query_ms()
+    by_page = {}
+    for sample in samples:
+        by_page.setdefault(sample.page, []).append(sample)
+
+    summary = []
+    for page, page_samples in by_page.items():
+        latencies = sorted(s.ms for s in page_samples)
+        summary.append({
+            "page": page,
+            "queries": len(page_samples),
+            "total_ms": sum(latencies),
+            "p50_ms": _percentile(latencies, 0.50),
+            "p95_ms": _percentile(latencies, 0.95),
+            "max_ms": latencies[-1],
+            "rows": sum(s.rows or 0 for s in page_samples),
+            "pool_wait_ms": sum(s.pool_wait_ms for s in page_samples),
+            "errors": sum(s.error for s in page_samples),
+            "slow": sum(s.ms >= slow_ms for s in page_samples),
+        })
+    return sorted(summary, key=lambda row: row["total_ms"], reverse=True)
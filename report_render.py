@@ -0,0 +1,256 @@
+import hashlib
+import io
+import math
+import os
+import threading
+import time
+from string import Template
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import pandas as pd
+import plotly.io as pio
+from xml.sax.saxutils import escape
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+# ✅ Kaleido already renders in its own subprocess, so a small thread pool keeps
+# rendering off the Streamlit script thread without pickling figures.
+RENDER_WORKERS = 2
+PDF_CACHE_SIZE = 64
+HTML_CACHE_SIZE = 64
+
+# ✅ Bundled TTF so product names outside Latin-1 render correctly
+REPORT_FONT = "DejaVuSans"
+REPORT_FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts", "DejaVuSans.ttf")
+MARGIN = 40
+CONTENT_WIDTH = letter[0] - 2 * MARGIN
+
+_executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="report-render")
+_pdf_cache = OrderedDict()
+_html_cache = OrderedDict()
+_jobs = {}
+_lock = threading.Lock()
+
+
+def data_version(*frames):
+    """Returns a short content hash of the report DataFrames, used as part of cache keys."""
+    digest = hashlib.sha1()
+    for df in frames:
+        digest.update(",".join(map(str, df.columns)).encode())
+        if not df.empty:
+            digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _register_fonts():
+    """Registers the bundled DejaVu Sans once so non-ASCII product names render in PDFs."""
+    if REPORT_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(REPORT_FONT, REPORT_FONT_PATH))
+
+
+def _cell(value, style):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    text = str(value)
+    # Only long text needs a wrapping Paragraph; plain strings are much cheaper to lay out
+    return Paragraph(escape(text), style) if len(text) > 20 else text
+
+
+def table_flowables(title, df, styles):
+    """Returns a heading plus a Table that splits across pages and repeats its header row."""
+    flowables = [Paragraph(escape(title), styles["heading"])]
+    if df.empty:
+        return flowables + [Paragraph("No data.", styles["cell"]), Spacer(1, 12)]
+
+    header = [Paragraph(escape(str(col)), styles["header"]) for col in df.columns]
+    rows = [header] + [[_cell(v, styles["cell"]) for v in row] for row in df.itertuples(index=False, name=None)]
+    col_width = CONTENT_WIDTH / len(df.columns)
+    table = Table(rows, colWidths=[col_width] * len(df.columns), repeatRows=1)
+    table.setStyle(TableStyle([
+        ("FONT", (0, 0), (-1, -1), REPORT_FONT, 8),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#f2f2f2")),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ]))
+    return flowables + [table, Spacer(1, 12)]
+
+
+def _number_pages(c, doc):
+    c.saveState()
+    c.setFont(REPORT_FONT, 8)
+    c.drawRightString(letter[0] - MARGIN, MARGIN / 2, f"Page {doc.page}")
+    c.restoreState()
+
+
+def create_pdf(df_av, df_archive, df_production, fig=None, progress=None):
+    """Renders the machine performance report as a paginated PDF in a single build pass.
+
+    ``fig`` may be None when there is no AV data; tables of any length flow
+    across as many pages as needed.
+    """
+    _register_fonts()
+    base = getSampleStyleSheet()
+    styles = {
+        "title": ParagraphStyle("title", parent=base["Title"], fontName=REPORT_FONT),
+        "heading": ParagraphStyle("heading", parent=base["Heading2"], fontName=REPORT_FONT),
+        "header": ParagraphStyle("header", parent=base["BodyText"], fontName=REPORT_FONT, fontSize=8, leading=10),
+        "cell": ParagraphStyle("cell", parent=base["BodyText"], fontName=REPORT_FONT, fontSize=8, leading=10),
+    }
+
+    story = [Paragraph("Machine Performance Report", styles["title"])]
+
+    # ✅ Convert Plotly graph to PNG once; the same buffer is embedded without copies
+    if fig is not None:
+        if progress:
+            progress(0.1, "Rendering chart…")
+        png = io.BytesIO(pio.to_image(fig, format="png", scale=3))
+        story += [Image(png, width=CONTENT_WIDTH, height=CONTENT_WIDTH * 0.4), Spacer(1, 12)]
+
+    # ✅ Add tables
+    if progress:
+        progress(0.6, "Laying out tables…")
+    story += table_flowables("Machine Activity Summary", df_archive, styles)
+    story += table_flowables("Production Summary", df_production, styles)
+    story += table_flowables("AV Data", df_av, styles)
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer, pagesize=letter, title="Machine Performance Report",
+        leftMargin=MARGIN, rightMargin=MARGIN, topMargin=MARGIN, bottomMargin=MARGIN,
+    )
+    doc.build(story, onFirstPage=_number_pages, onLaterPages=_number_pages)
+    return buffer.getvalue()
+
+
+class RenderJob:
+    """A PDF render running (or finished) in the background pool."""
+
+    def __init__(self, key):
+        self.key = key
+        self.progress = 0.0
+        self.stage = "Queued…"
+        self.future = None
+
+    def update(self, progress, stage):
+        self.progress, self.stage = progress, stage
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        return self.future.result()
+
+
+def _cache_pdf(key, pdf):
+    with _lock:
+        _pdf_cache[key] = pdf
+        _pdf_cache.move_to_end(key)
+        while len(_pdf_cache) > PDF_CACHE_SIZE:
+            _pdf_cache.popitem(last=False)
+        _jobs.pop(key, None)
+    return pdf
+
+
+def render_pdf_async(branch, date, shift, df_av, df_archive, df_production, fig=None):
+    """Starts (or reuses) a background PDF render cached by (branch, date, shift, data version).
+
+    Returns a RenderJob; a report rendered before completes immediately.
+    """
+    key = (branch, str(date), shift, data_version(df_av, df_archive, df_production))
+    job = RenderJob(key)
+
+    def run():
+        pdf = create_pdf(df_av, df_archive, df_production, fig, progress=job.update)
+        job.update(1.0, "Done")
+        return _cache_pdf(key, pdf)
+
+    def forget_failed(future):
+        if future.exception() is not None:
+            with _lock:
+                _jobs.pop(key, None)
+
+    # ✅ Lookup, registration and submit under one lock: concurrent clicks share one render, and
+    # run() cannot reach _cache_pdf (which drops the job) before the job is registered
+    with _lock:
+        running = _jobs.get(key)
+        if running is not None:
+            return running
+        cached = _pdf_cache.get(key)
+        if cached is not None:
+            _pdf_cache.move_to_end(key)
+            job.future = Future()
+            job.future.set_result(cached)
+            job.update(1.0, "Done")
+            return job
+        job.future = _executor.submit(run)
+        _jobs[key] = job
+    # Outside the lock: an already failed future runs the callback in this thread
+    job.future.add_done_callback(forget_failed)
+    return job
+
+
+HTML_HEAD = Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+<style>
+body { font-family: Arial, sans-serif; padding: 20px; }
+table { width: 100%; border-collapse: collapse; margin: 20px 0; }
+th, td { border: 1px solid black; padding: 8px; text-align: left; }
+th { background-color: #f2f2f2; }
+.graph-container { text-align: center; margin: 20px 0; }
+</style>
+</head>
+<body>
+<h1>📊 $title</h1>
+""")
+HTML_SECTION = Template("<h2>$heading</h2>\n")
+HTML_TAIL = "</body>\n</html>\n"
+
+
+def iter_report_html(df_av, df_archive, df_production, fig=None, title="Machine Performance Report"):
+    """Streams the HTML report piece by piece from fixed templates (no parse/prettify pass)."""
+    yield HTML_HEAD.substitute(title=title)
+    if fig is not None:
+        yield '<div class="graph-container">'
+        yield fig.to_html(full_html=False)
+        yield "</div>\n"
+    for heading, df in (
+        ("📋 Machine Activity Summary", df_archive),
+        ("🏭 Production Summary", df_production),
+        ("📈 AV Data", df_av),
+    ):
+        yield HTML_SECTION.substitute(heading=heading)
+        yield df.to_html(index=False)
+        yield "\n"
+    yield HTML_TAIL
+
+
+def render_html(branch, date, shift, df_av, df_archive, df_production, fig=None):
+    """Returns (html bytes, render ms, cached?) for a report, cached by (branch, date, shift, data version)."""
+    key = (branch, str(date), shift, data_version(df_av, df_archive, df_production))
+    with _lock:
+        cached = _html_cache.get(key)
+        if cached is not None:
+            _html_cache.move_to_end(key)
+            return cached[0], cached[1], True
+
+    start = time.perf_counter()
+    buffer = io.StringIO()
+    for chunk in iter_report_html(df_av, df_archive, df_production, fig):
+        buffer.write(chunk)
+    html = buffer.getvalue().encode("utf-8")
+    render_ms = (time.perf_counter() - start) * 1000
+
+    with _lock:
+        _html_cache[key] = (html, render_ms)
+        while len(_html_cache) > HTML_CACHE_SIZE:
+            _html_cache.popitem(last=False)
+    return html, render_ms, False
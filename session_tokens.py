@@ -0,0 +1,137 @@
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+import streamlit as st
+
+# ✅ Signed session tokens let a page reload restore the login from the URL without
+# touching the users table or bcrypt. Enabled when `[auth] session_key` is set in st.secrets.
+# Active sessions slide forward (reissued within REFRESH_BEFORE of expiry), so the TTL only
+# bounds how long an idle tablet or a URL in browser history stays logged in.
+SESSION_TTL = 2 * 3600  # seconds; override with `[auth] session_ttl`
+SESSION_PARAM = "session"
+REFRESH_BEFORE = 1800  # reissue tokens that expire within this many seconds
+
+# ✅ Revocation: tokens issued before a user's "not before" time are rejected. Logout and
+# user-management edits bump it; tokens from before this process started are never trusted,
+# so a restart cannot resurrect revoked tokens.
+_PROCESS_STARTED = time.time()
+_not_before = {}  # username -> timestamp
+_not_before_lock = threading.Lock()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _get_key():
+    key = st.secrets.get("auth", {}).get("session_key")
+    return key.encode() if key else None
+
+
+def _sign(key, payload):
+    return _b64encode(hmac.new(key, payload.encode(), hashlib.sha256).digest())
+
+
+def issue_token(username, role, branch, now=None):
+    """Returns a signed token carrying username, role, branch and an expiry, or None if disabled."""
+    key = _get_key()
+    if key is None:
+        return None
+    ttl = st.secrets.get("auth", {}).get("session_ttl", SESSION_TTL)
+    now = now or time.time()
+    claims = {"u": username, "r": role, "b": branch, "iat": now, "exp": int(now + ttl)}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(key, payload)}"
+
+
+def revoke_user_sessions(username):
+    """Invalidates every token issued so far for ``username`` (logout, role/branch/password change, deletion)."""
+    with _not_before_lock:
+        _not_before[username] = time.time()
+
+
+def is_revoked(claims):
+    not_before = max(_not_before.get(claims.get("u"), 0), _PROCESS_STARTED)
+    return claims.get("iat", 0) <= not_before
+
+
+def _decode(token, now=None):
+    """Returns the claims of a correctly signed, unexpired token (revocation not checked)."""
+    key = _get_key()
+    if key is None or not token or token.count(".") != 1:
+        return None
+    payload, signature = token.split(".")
+    if not hmac.compare_digest(signature, _sign(key, payload)):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims.get("exp", 0) < (now or time.time()):
+        return None
+    return claims
+
+
+def verify_token(token, now=None):
+    """Returns the token's claims {"u", "r", "b", "iat", "exp"} if it is signed, unexpired and not revoked."""
+    claims = _decode(token, now)
+    if claims is None or is_revoked(claims):
+        return None
+    return claims
+
+
+def restore_session():
+    """Restores username/role/branch into st.session_state from the URL token; returns True on success."""
+    token = st.query_params.get(SESSION_PARAM)
+    claims = verify_token(token)
+    if claims is None:
+        return False
+    st.session_state["authenticated"] = True
+    st.session_state["username"] = claims["u"]
+    st.session_state["role"] = claims["r"]
+    st.session_state["branch"] = claims["b"]
+    st.session_state["session_token"] = token
+    return True
+
+
+def persist_session():
+    """Keeps a token for the current session state in the URL so a reload can restore it.
+
+    Reissued only when the user, role or branch changed or the token is close to expiry;
+    page navigation drops query params, so the current token is put back on every page.
+    """
+    token = st.session_state.get("session_token")
+    claims = _decode(token)
+    if claims is not None and is_revoked(claims):
+        # Logged out elsewhere or changed in User Management: this session ends too
+        clear_session()
+        st.warning("Your session has ended. Please log in again.")
+        st.stop()
+    current = (st.session_state.get("username"), st.session_state.get("role"), st.session_state.get("branch"))
+    if claims is None or (claims["u"], claims["r"], claims["b"]) != current or claims["exp"] - time.time() < REFRESH_BEFORE:
+        token = issue_token(*current)
+        if token is None:
+            return
+        st.session_state["session_token"] = token
+    if st.query_params.get(SESSION_PARAM) != token:
+        st.query_params[SESSION_PARAM] = token
+
+
+def clear_session(revoke=False):
+    """Forgets the token in the URL and the login in st.session_state.
+
+    With ``revoke`` (logout) every token of the user stops working, including
+    copies in browser history.
+    """
+    if revoke and st.session_state.get("username"):
+        revoke_user_sessions(st.session_state["username"])
+    st.query_params.pop(SESSION_PARAM, None)
+    for key in ("authenticated", "username", "role", "branch", "session_token"):
+        st.session_state.pop(key, None)
@@ -0,0 +1,202 @@
+import argparse
+import io
+import os
+import time
+from collections import namedtuple
+import pandas as pd
+from db import get_sqlalchemy_engine
+from shifts import get_shift_definitions
+from shift_records import ShiftKey, validate_shift_totals
+from daily_summary import refresh_daily_summary
+from shift_store import ARCHIVE_COLUMNS, ARCHIVE_KEY, ARCHIVE_NUMERIC, AV_COLUMNS, AV_KEY, AV_NUMERIC
+
+# ✅ Header spellings found in historical exports
+ARCHIVE_RENAMES = {"commnets": "comments"}
+
+DEFAULT_CHUNKSIZE = 50_000
+
+ImportResult = namedtuple("ImportResult", ["loaded_keys", "archive_rows", "av_rows", "rejected", "seconds"])
+
+
+def iter_chunks(source, chunksize=DEFAULT_CHUNKSIZE):
+    """Yields DataFrame chunks from a CSV or Excel path/file-like object.
+
+    CSV files are streamed; Excel files have no streaming reader and are sliced after loading.
+    """
+    if hasattr(source, "seek"):
+        source.seek(0)
+    name = getattr(source, "name", source)
+    if str(name).lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(source)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+    else:
+        yield from pd.read_csv(source, chunksize=chunksize, encoding="utf-8-sig")
+
+
+def _normalize(df, columns, numeric, key, renames=None):
+    """Strips headers, applies renames, coerces numeric columns and normalises the key columns."""
+    df = df.rename(columns=lambda c: str(c).strip())
+    if renames:
+        df = df.rename(columns=renames)
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    df = df[columns].copy()
+    for col in numeric:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df[key[0]] = pd.to_datetime(df[key[0]]).dt.date
+    for col in key[1:]:
+        df[col] = df[col].astype(str).str.strip()
+    return df
+
+
+def _keys(df, key):
+    return list(zip(*(df[col] for col in key)))
+
+
+def collect_shift_totals(archive_source, av_source, chunksize=DEFAULT_CHUNKSIZE):
+    """First streaming pass: per-(date, shift, machine) totals needed for validation.
+
+    Only aggregates are kept in memory, never the rows themselves.
+    """
+    totals = {}
+    for chunk in iter_chunks(archive_source, chunksize):
+        chunk = _normalize(chunk, ARCHIVE_COLUMNS, ARCHIVE_NUMERIC, ARCHIVE_KEY, ARCHIVE_RENAMES)
+        grouped = chunk.groupby(ARCHIVE_KEY, sort=False).agg(time=("time", "sum"), efficiency=("efficiency", "max"))
+        for key, row in grouped.iterrows():
+            total_time, max_eff = totals.get(key, (0.0, None))
+            eff = row["efficiency"]
+            if pd.notna(eff):
+                max_eff = eff if max_eff is None else max(max_eff, eff)
+            totals[key] = (total_time + row["time"], max_eff)
+
+    shift_info = {}
+    for chunk in iter_chunks(av_source, chunksize):
+        chunk = _normalize(chunk, AV_COLUMNS, AV_NUMERIC, AV_KEY)
+        for key, shift_code, hours in zip(_keys(chunk, AV_KEY), chunk["shift type"], chunk["hours"]):
+            shift_info[key] = (str(shift_code).strip(), hours)
+    return totals, shift_info
+
+
+def validate_import(totals, shift_info):
+    """Applies the "Approve and Save" rules per shift; returns (valid keys, {key: reason})."""
+    shift_hours = get_shift_definitions().hours
+    valid, rejected = set(), {}
+    for key in set(totals) | set(shift_info):
+        if key not in shift_info:
+            rejected[key] = "No av row for this shift."
+            continue
+        if key not in totals:
+            rejected[key] = "No archive rows for this shift."
+            continue
+        shift_code, hours = shift_info[key]
+        standard_shift_time = hours if pd.notna(hours) and hours else shift_hours.get(shift_code)
+        total_time, max_eff = totals[key]
+        error = validate_shift_totals(shift_code, total_time, max_eff, standard_shift_time)
+        if error:
+            rejected[key] = error
+        else:
+            valid.add(key)
+    return valid, rejected
+
+
+def _delete_shifts(cur, table, key_columns, keys):
+    """Deletes existing rows for a batch of (date, shift, machine) keys in one statement."""
+    if not keys:
+        return
+    dates, shifts, machines = zip(*keys)
+    cols = ", ".join(f'"{c}"' for c in key_columns)
+    cur.execute(
+        f"DELETE FROM {table} WHERE ({cols}) IN "
+        "(SELECT * FROM unnest(%s::date[], %s::text[], %s::text[]))",
+        (list(dates), list(shifts), list(machines)),
+    )
+
+
+def _copy_rows(cur, table, columns, df):
+    """Streams a DataFrame chunk into a table with COPY FROM STDIN."""
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cols = ", ".join(f'"{c}"' for c in columns)
+    cur.copy_expert(f"COPY {table} ({cols}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _load_table(cur, source, table, columns, numeric, key, valid, chunksize, renames=None, progress=None):
+    """Second streaming pass: replaces each valid shift once, then COPYs its rows."""
+    replaced = set()
+    rows = 0
+    for chunk in iter_chunks(source, chunksize):
+        chunk = _normalize(chunk, columns, numeric, key, renames)
+        keys = _keys(chunk, key)
+        chunk = chunk[[k in valid for k in keys]]
+        if chunk.empty:
+            continue
+        # ✅ A shift may span chunks: only delete it the first time it is seen
+        new_keys = {k for k in _keys(chunk, key)} - replaced
+        _delete_shifts(cur, table, key, new_keys)
+        replaced |= new_keys
+        _copy_rows(cur, table, columns, chunk)
+        rows += len(chunk)
+        if progress:
+            progress(table, rows)
+    return rows
+
+
+def import_shift_reports(archive_source, av_source, branch="main", chunksize=DEFAULT_CHUNKSIZE, dry_run=False, progress=None):
+    """Validates and bulk-loads historical archive/av files into a branch database.
+
+    Each (date, shift, machine) is replaced atomically, so re-running an import
+    is idempotent. Shifts failing validation are skipped and reported.
+    """
+    start = time.perf_counter()
+    totals, shift_info = collect_shift_totals(archive_source, av_source, chunksize)
+    valid, rejected = validate_import(totals, shift_info)
+
+    archive_rows = av_rows = 0
+    if valid and not dry_run:
+        conn = get_sqlalchemy_engine(branch).raw_connection()
+        try:
+            with conn.cursor() as cur:
+                archive_rows = _load_table(cur, archive_source, "archive", ARCHIVE_COLUMNS, ARCHIVE_NUMERIC,
+                                           ARCHIVE_KEY, valid, chunksize, ARCHIVE_RENAMES, progress)
+                av_rows = _load_table(cur, av_source, "av", AV_COLUMNS, AV_NUMERIC,
+                                      AV_KEY, valid, chunksize, progress=progress)
+                refresh_daily_summary(cur, [ShiftKey(date, machine, shift) for date, shift, machine in valid])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    return ImportResult(sorted(valid), archive_rows, av_rows, rejected, time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import historical shift reports (archive + av).")
+    parser.add_argument("--archive", required=True, help="archive CSV/Excel file")
+    parser.add_argument("--av", required=True, help="av CSV/Excel file")
+    parser.add_argument("--branch", default="main", help="branch database to load into")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--dry-run", action="store_true", help="validate only, do not write")
+    args = parser.parse_args(argv)
+
+    for path in (args.archive, args.av):
+        if not os.path.exists(path):
+            parser.error(f"File not found: {path}")
+
+    result = import_shift_reports(
+        args.archive, args.av, branch=args.branch, chunksize=args.chunksize, dry_run=args.dry_run,
+        progress=lambda table, rows: print(f"… {table}: {rows} rows loaded"),
+    )
+    for key, reason in sorted(result.rejected.items()):
+        print(f"❌ {key[0]} {key[1]} {key[2]}: {reason}")
+    print(f"✅ {len(result.loaded_keys)} shifts valid, {result.archive_rows} archive rows and "
+          f"{result.av_rows} av rows loaded in {result.seconds:.1f}s ({len(result.rejected)} rejected)")
+    return 1 if result.rejected else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,152 @@
+from dataclasses import dataclass
+import datetime
+
+# ✅ OEE quality factor applied to every shift
+QUALITY_FACTOR = 0.99
+
+# ✅ Partial shifts are measured against recorded time instead of a standard shift length
+PARTIAL_SHIFT_CODE = "partial"
+
+
+@dataclass(frozen=True, slots=True)
+class ShiftKey:
+    """Identifies a shift report: one machine, one date, one Day/Night/Plan shift."""
+    date: datetime.date
+    machine: str
+    shift: str
+
+
+@dataclass(frozen=True, slots=True)
+class DowntimeEntry:
+    activity: str
+    hours: float
+    comment: str = ""
+
+
+@dataclass(frozen=True, slots=True)
+class BatchEntry:
+    product: str
+    batch: str
+    quantity: float
+    time_consumed: float
+
+
+@dataclass(frozen=True, slots=True)
+class ShiftRecord:
+    """Result of compute_shift_record(): rows ready for the archive/av tables plus totals."""
+    archive_rows: list
+    av_row: dict
+    total_production_time: float
+    total_downtime: float
+    total_recorded_time: float
+    standard_shift_time: float | None
+    average_efficiency: float
+    availability: float
+    oee: float
+
+
+def compute_shift_record(key, downtime, batches, shift_code, standard_shift_time, rates):
+    """Builds the archive rows and the av row for a shift in a single pass, without any UI calls.
+
+    ``downtime`` is an iterable of DowntimeEntry (entries with zero hours are
+    skipped), ``batches`` an iterable of BatchEntry, ``standard_shift_time``
+    the working hours of ``shift_code`` (None if unknown) and ``rates`` maps
+    product -> standard rate; products without a rate use 1.
+    """
+    archive_rows = []
+    total_downtime = 0.0
+    for entry in downtime:
+        if entry.hours <= 0:
+            continue
+        total_downtime += entry.hours
+        archive_rows.append({
+            "Date": key.date,
+            "Machine": key.machine,
+            "Day/Night/plan": key.shift,
+            "Activity": entry.activity,
+            "time": entry.hours,
+            "Product": "",
+            "batch number": "",
+            "quantity": "",
+            "comments": entry.comment,
+            "rate": "",
+            "standard rate": "",
+            "efficiency": "",
+        })
+
+    total_production_time = 0.0
+    efficiencies = []
+    for batch in batches:
+        rate = batch.quantity / batch.time_consumed if batch.time_consumed != 0 else 0
+        standard_rate = rates.get(batch.product) or 1  # Avoid division by zero
+        efficiency = rate / standard_rate
+        efficiencies.append(efficiency)
+        total_production_time += batch.time_consumed
+        archive_rows.append({
+            "Date": key.date,
+            "Machine": key.machine,
+            "Day/Night/plan": key.shift,
+            "Activity": "Production",
+            "time": batch.time_consumed,
+            "Product": batch.product,
+            "batch number": batch.batch,
+            "quantity": batch.quantity,
+            "comments": "",
+            "rate": rate,
+            "standard rate": standard_rate,
+            "efficiency": efficiency,
+        })
+
+    average_efficiency = sum(efficiencies) / len(efficiencies) if efficiencies else 0
+    total_recorded_time = total_production_time + total_downtime
+
+    if shift_code == PARTIAL_SHIFT_CODE:
+        availability = total_production_time / total_recorded_time if total_recorded_time != 0 else 0
+    else:
+        availability = total_production_time / standard_shift_time if standard_shift_time else 0
+
+    oee = QUALITY_FACTOR * availability * average_efficiency
+    av_row = {
+        "date": key.date,
+        "machine": key.machine,
+        "shift type": shift_code,
+        "hours": standard_shift_time,
+        "shift": key.shift,
+        "T.production time": total_production_time,
+        "Availability": availability,
+        "Av Efficiency": average_efficiency,
+        "OEE": oee,
+    }
+
+    return ShiftRecord(
+        archive_rows=archive_rows,
+        av_row=av_row,
+        total_production_time=total_production_time,
+        total_downtime=total_downtime,
+        total_recorded_time=total_recorded_time,
+        standard_shift_time=standard_shift_time,
+        average_efficiency=average_efficiency,
+        availability=availability,
+        oee=oee,
+    )
+
+
+# ✅ Partial shifts may not record more than this many hours
+PARTIAL_SHIFT_MAX_HOURS = 7
+
+
+def validate_shift_totals(shift_code, total_recorded_time, max_efficiency, standard_shift_time):
+    """Applies the "Approve and Save" rules to a shift; returns an error message or None if valid."""
+    if max_efficiency is not None and max_efficiency > 1:
+        return "Efficiency must not exceed 1. Please review and modify the data."
+    if shift_code == PARTIAL_SHIFT_CODE:
+        if total_recorded_time > PARTIAL_SHIFT_MAX_HOURS:
+            return f"Total recorded time ({total_recorded_time} hrs) exceeds {PARTIAL_SHIFT_MAX_HOURS} hrs for a partial shift. Modify the data."
+        return None
+    if not standard_shift_time:
+        return f"Shift duration '{shift_code}' not found in shifts.csv."
+    if total_recorded_time > standard_shift_time:
+        return f"Total recorded time ({total_recorded_time} hrs) exceeds shift standard time ({standard_shift_time} hrs). Modify the data."
+    if total_recorded_time < 0.9 * standard_shift_time:
+        return f"Total recorded time ({total_recorded_time} hrs) is less than 90% of shift standard time ({0.9 * standard_shift_time} hrs). Modify the data."
+    return None
@@ -0,0 +1,146 @@
+import time
+from contextlib import contextmanager
+import pandas as pd
+from psycopg2.extras import execute_values
+from db import get_sqlalchemy_engine
+from daily_summary import refresh_daily_summary
+
+# ✅ Column order of the archive/av tables (matches archive.csv / av.csv)
+ARCHIVE_COLUMNS = [
+    "Date", "Machine", "Day/Night/plan", "Activity", "time", "Product",
+    "batch number", "quantity", "comments", "rate", "standard rate", "efficiency",
+]
+AV_COLUMNS = [
+    "date", "machine", "shift type", "hours", "shift",
+    "T.production time", "Availability", "Av Efficiency", "OEE",
+]
+ARCHIVE_NUMERIC = ["time", "quantity", "rate", "standard rate", "efficiency"]
+AV_NUMERIC = ["hours", "T.production time", "Availability", "Av Efficiency", "OEE"]
+
+# (date, shift, machine) column names per table
+ARCHIVE_KEY = ["Date", "Day/Night/plan", "Machine"]
+AV_KEY = ["date", "shift", "machine"]
+
+
+def _column_list(columns):
+    return ", ".join(f'"{c}"' for c in columns)
+
+
+# ✅ Prepared once; execute_values expands the single %s into a multi-row VALUES list
+INSERT_ARCHIVE_SQL = f"INSERT INTO archive ({_column_list(ARCHIVE_COLUMNS)}) VALUES %s"
+INSERT_AV_SQL = f"INSERT INTO av ({_column_list(AV_COLUMNS)}) VALUES %s"
+
+
+def _rows(df, columns, numeric):
+    """Returns DataFrame rows as tuples in table column order, with NaN/"" numerics as NULL."""
+    df = df.reindex(columns=columns).copy()
+    for col in numeric:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df = df.astype(object).where(pd.notna(df), None)
+    return list(df.itertuples(index=False, name=None))
+
+
+# ✅ Backs the one-report-per-(date, shift, machine) rule (applied by migrations.py); archive holds many rows per key
+AV_UNIQUE_INDEX_SQL = 'CREATE UNIQUE INDEX IF NOT EXISTS av_date_shift_machine_key ON av ("date", "shift", "machine")'
+
+# Databases saved before the unique key can hold the same report twice (racy select-then-delete save):
+# identical copies are dropped, keys whose rows differ are listed for a manual fix
+AV_DEDUPE_SQL = """
+    DELETE FROM av a USING av b
+    WHERE a."date" = b."date" AND a."shift" = b."shift" AND a."machine" = b."machine"
+      AND a.ctid > b.ctid AND ROW(a.*) IS NOT DISTINCT FROM ROW(b.*)
+"""
+AV_DUPLICATE_KEYS_SQL = """
+    SELECT "date", "shift", "machine", COUNT(*) FROM av
+    WHERE "date" IS NOT NULL AND "shift" IS NOT NULL AND "machine" IS NOT NULL
+    GROUP BY "date", "shift", "machine" HAVING COUNT(*) > 1
+    ORDER BY "date", "shift", "machine"
+"""
+
+_KEY_FILTER_AV = '"date" = %(date)s AND "shift" = %(shift)s AND "machine" = %(machine)s'
+_KEY_FILTER_ARCHIVE = '"Date" = %(date)s AND "Day/Night/plan" = %(shift)s AND "Machine" = %(machine)s'
+
+# ✅ Serialises concurrent saves of the same shift for the rest of the transaction
+_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext(%(lock_key)s));"
+
+_EXISTS_SQL = f"""
+    SELECT EXISTS (SELECT 1 FROM av WHERE {_KEY_FILTER_AV})
+        OR EXISTS (SELECT 1 FROM archive WHERE {_KEY_FILTER_ARCHIVE})
+"""
+
+_DELETE_SQL = f"""
+    WITH deleted_av AS (DELETE FROM av WHERE {_KEY_FILTER_AV} RETURNING 1),
+         deleted_archive AS (DELETE FROM archive WHERE {_KEY_FILTER_ARCHIVE} RETURNING 1)
+    SELECT (SELECT COUNT(*) FROM deleted_av), (SELECT COUNT(*) FROM deleted_archive)
+"""
+
+
+class ShiftReportExistsError(Exception):
+    """Raised when saving a shift report that already exists without asking to replace it."""
+
+
+def _key_params(key):
+    return {
+        "date": key.date,
+        "shift": key.shift,
+        "machine": key.machine,
+        "lock_key": f"shift_report:{key.date}:{key.shift}:{key.machine}",
+    }
+
+
+@contextmanager
+def _transaction(branch=None):
+    """Yields a raw psycopg2 cursor from the branch engine pool inside one transaction."""
+    conn = get_sqlalchemy_engine(branch).raw_connection()
+    try:
+        with conn.cursor() as cur:
+            yield cur
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def shift_report_exists(key, branch=None):
+    """Returns True if av or archive already holds rows for the shift (index-only EXISTS probes)."""
+    with _transaction(branch) as cur:
+        cur.execute(_EXISTS_SQL, _key_params(key))
+        return cur.fetchone()[0]
+
+
+def insert_shift_rows(cur, archive_df, av_df):
+    """Inserts archive and av rows with one multi-row INSERT per table on an open cursor."""
+    archive_rows = _rows(archive_df, ARCHIVE_COLUMNS, ARCHIVE_NUMERIC)
+    av_rows = _rows(av_df, AV_COLUMNS, AV_NUMERIC)
+    if archive_rows:
+        execute_values(cur, INSERT_ARCHIVE_SQL, archive_rows, page_size=500)
+    if av_rows:
+        execute_values(cur, INSERT_AV_SQL, av_rows, page_size=500)
+    return len(archive_rows), len(av_rows)
+
+
+def save_shift_report(key, archive_df, av_df, replace=False, branch=None):
+    """Writes a shift's archive and av rows in a single transaction.
+
+    With ``replace=True`` any existing report for the same (date, shift, machine)
+    is deleted in the same transaction; otherwise ShiftReportExistsError is
+    raised if one exists. Both tables and the daily_machine_summary rollup are
+    written in the same transaction, or nothing is.
+    Returns the elapsed seconds.
+    """
+    start = time.perf_counter()
+    params = _key_params(key)
+    with _transaction(branch) as cur:
+        if replace:
+            cur.execute(_LOCK_SQL + _DELETE_SQL, params)
+        else:
+            cur.execute(_LOCK_SQL + _EXISTS_SQL, params)
+            if cur.fetchone()[0]:
+                raise ShiftReportExistsError(
+                    f"A report for {key.date} / {key.shift} / {key.machine} already exists."
+                )
+        insert_shift_rows(cur, archive_df, av_df)
+        refresh_daily_summary(cur, [key])
+    return time.perf_counter() - start
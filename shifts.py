@@ -0,0 +1,44 @@
+import csv
+import os
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+# ✅ Resolved next to this module so it works regardless of the working directory
+SHIFTS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shifts.csv")
+
+# codes: shift codes in file order, hours: read-only {code: working hours}
+ShiftDefinitions = namedtuple("ShiftDefinitions", ["codes", "hours", "mtime"])
+
+_definitions = None
+_definitions_lock = threading.Lock()
+
+
+def _read_shifts(path):
+    """Parses shifts.csv into an immutable ShiftDefinitions."""
+    codes = []
+    hours = {}
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            code = row["code"].strip()
+            codes.append(code)
+            hours[code] = float(row["working hours"])
+    return ShiftDefinitions(tuple(codes), MappingProxyType(hours), os.path.getmtime(path))
+
+
+def get_shift_definitions():
+    """Returns the shift definitions, re-reading the file only when its mtime changes.
+
+    Raises FileNotFoundError if the file is missing.
+    """
+    global _definitions
+
+    mtime = os.path.getmtime(SHIFTS_CSV)
+    current = _definitions
+    if current is not None and current.mtime == mtime:
+        return current
+
+    with _definitions_lock:
+        if _definitions is None or _definitions.mtime != mtime:
+            _definitions = _read_shifts(SHIFTS_CSV)
+        return _definitions
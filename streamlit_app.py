@@ -1,6 +1,7 @@
 import streamlit as st
 from auth import authenticate_user, ROLE_ACCESS
-from db import get_branches
+from session_tokens import persist_session
+from db import get_branches, warm_engines
 
 # Hide Streamlit's menu and "Manage app" button
 st.markdown("""
@@ -24,6 +25,7 @@ st.session_state["authenticated"] = True
 st.session_state["username"] = user["username"]
 st.session_state["role"] = user.get("role", "user")  # Default to "user"
 st.session_state["branch"] = user.get("branch", "main")  # Default branch is "main"
+persist_session()  # ✅ Signed token in the URL survives reloads (reissued when the branch changes)
 
 # ✅ Ensure branch exists after authentication
 branch = st.session_state["branch"]
@@ -32,9 +34,10 @@ display_branch = "October SDF" if branch == "main" else branch
 # ✅ Show user details
 st.markdown(f"**👤 Role:** `{st.session_state['role']}`  |  **🏢 Branch:** `{display_branch}`")
 
-# ✅ Admins can select a branch
+# ✅ Admins can select a branch (cached catalogue; every branch pool is kept warm)
 if st.session_state["role"] == "admin":
     branches = get_branches()
+    warm_engines(branches)
     selected_branch = st.selectbox(
         "Select a branch:", branches, 
         index=branches.index(branch) if branch in branches else 0
@@ -67,5 +70,11 @@ if "user management" in allowed_pages:
 if "extract_data" in allowed_pages:
     st.page_link("pages/extract_data.py", label="Extract Data")
 
+if "bulk_import" in allowed_pages:
+    st.page_link("pages/bulk_import.py", label="Bulk Import")
+
+if "diagnostics" in allowed_pages:
+    st.page_link("pages/diagnostics.py", label="Diagnostics")
+
 # ✅ Success message
 st.success(f"Now working on: {display_branch}")
@@ -0,0 +1,70 @@
+import builtins
+import os
+import symtable
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _undefined_globals(path):
+    """Names read as globals inside functions but never bound at module level or in builtins."""
+    with open(path, encoding="utf-8") as f:
+        module = symtable.symtable(f.read(), path, "exec")
+    defined = {s.get_name() for s in module.get_symbols() if s.is_assigned() or s.is_imported()}
+    defined |= set(dir(builtins))
+
+    missing = set()
+    stack = list(module.get_children())
+    while stack:
+        table = stack.pop()
+        stack.extend(table.get_children())
+        for symbol in table.get_symbols():
+            if symbol.is_referenced() and symbol.is_global() and symbol.get_name() not in defined:
+                missing.add(symbol.get_name())
+    return missing
+
+
+@pytest.mark.parametrize("module", ["auth.py", "session_tokens.py", "passwords.py"])
+def test_no_undefined_globals(module):
+    assert _undefined_globals(os.path.join(ROOT, module)) == set()
+
+
+def _fake_streamlit():
+    return types.SimpleNamespace(
+        secrets={"auth": {"session_key": "test-key"}}, query_params={}, session_state={},
+        warning=lambda *a, **k: None, stop=lambda: (_ for _ in ()).throw(SystemExit),
+    )
+
+
+def test_auth_imports():
+    pytest.importorskip("streamlit")
+    pytest.importorskip("psycopg2")
+    pytest.importorskip("sqlalchemy")
+    pytest.importorskip("bcrypt")
+    import auth
+
+    assert callable(auth.check_authentication) and callable(auth.authenticate_user)
+
+
+def test_session_token_round_trip_and_revocation(monkeypatch):
+    pytest.importorskip("streamlit")
+    import session_tokens
+
+    fake = _fake_streamlit()
+    monkeypatch.setattr(session_tokens, "st", fake)
+
+    token = session_tokens.issue_token("op1", "user", "main")
+    claims = session_tokens.verify_token(token)
+    assert (claims["u"], claims["r"], claims["b"]) == ("op1", "user", "main")
+    assert session_tokens.verify_token(token[:-2] + "xx") is None
+    assert session_tokens.verify_token(token, now=claims["exp"] + 1) is None
+
+    fake.query_params[session_tokens.SESSION_PARAM] = token
+    assert session_tokens.restore_session()
+    assert fake.session_state["username"] == "op1"
+
+    session_tokens.clear_session(revoke=True)
+    assert session_tokens.SESSION_PARAM not in fake.query_params
+    assert session_tokens.verify_token(token) is None  # a copy from browser history no longer works
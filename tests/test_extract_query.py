@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from extract_query import ExtractSpec, build_extract_sql, count_sql, summary_spec  # noqa: E402
+
+START, END = datetime.date(2024, 1, 1), datetime.date(2024, 1, 31)
+
+
+def test_projection_and_filters_are_bound():
+    spec = ExtractSpec("av", START, END, machines=("M1", "M2"), products=("P1",), columns=("machine", "OEE"))
+    sql, params = build_extract_sql(spec)
+    # products has no av column, so it is ignored for av
+    assert sql == 'SELECT "machine", "OEE" FROM av WHERE "date" BETWEEN :start AND :end AND "machine" = ANY(:machines)'
+    assert params == {"start": START, "end": END, "machines": ["M1", "M2"]}
+
+
+def test_statement_text_does_not_depend_on_filter_values():
+    one, _ = build_extract_sql(ExtractSpec("archive", START, END, products=("P1",)))
+    other, params = build_extract_sql(ExtractSpec("archive", START, END, products=("x'; DROP TABLE archive; --",)))
+    assert one == other
+    assert params["products"] == ["x'; DROP TABLE archive; --"]
+
+
+def test_unfiltered_extract_selects_every_column():
+    sql, params = build_extract_sql(ExtractSpec("archive", START, END))
+    assert sql == 'SELECT * FROM archive WHERE "Date" BETWEEN :start AND :end'
+    assert params == {"start": START, "end": END}
+
+
+def test_aggregate_groups_by_period_and_columns():
+    spec = ExtractSpec("archive", START, END, group_by=("Machine",), aggregates={"quantity": "sum"}, grain="month")
+    sql, _ = build_extract_sql(spec)
+    assert sql == (
+        'SELECT date_trunc(\'month\', "Date")::date AS period, "Machine", SUM("quantity") AS "sum_quantity", '
+        'COUNT(*) AS rows FROM archive WHERE "Date" BETWEEN :start AND :end GROUP BY 1, 2 ORDER BY 1, 2'
+    )
+
+
+@pytest.mark.parametrize("spec", [
+    ExtractSpec("users", START, END),
+    ExtractSpec("av", START, END, columns=('machine" FROM users; --',)),
+    ExtractSpec("av", START, END, columns=("Product",)),  # archive column, not av
+    ExtractSpec("av", START, END, group_by=("password",), aggregates={"OEE": "avg"}),
+    ExtractSpec("av", START, END, aggregates={"OEE": "avg); DROP TABLE av; --"}),
+    ExtractSpec("av", START, END, aggregates={'OEE") FROM users; --': "avg"}),
+    ExtractSpec("av", START, END, aggregates={"OEE": "avg"}, grain="year'); --"),
+    ExtractSpec("av", START, END, group_by=("machine",)),  # group_by without an aggregate
+])
+def test_names_outside_the_whitelist_are_rejected(spec):
+    with pytest.raises(ValueError):
+        build_extract_sql(spec)
+
+
+def test_count_sql_wraps_the_extract():
+    spec = ExtractSpec("av", START, END, shifts=("Day",))
+    sql, params = build_extract_sql(spec)
+    counted, count_params = count_sql(spec)
+    assert counted == f"SELECT COUNT(*) FROM ({sql}) AS extract"
+    assert count_params == params
+
+
+def test_summary_spec_uses_the_table_preset():
+    spec = summary_spec("av", START, END, "week", machines=("M1",))
+    assert spec.group_by == ("machine", "shift")
+    assert spec.grain == "week" and spec.machines == ("M1",)
+    sql, _ = build_extract_sql(spec)
+    assert 'AVG("OEE") AS "avg_OEE"' in sql and sql.endswith("GROUP BY 1, 2, 3 ORDER BY 1, 2, 3")
@@ -0,0 +1,77 @@
+import datetime
+
+import pytest
+
+from shift_records import (
+    PARTIAL_SHIFT_CODE, PARTIAL_SHIFT_MAX_HOURS, QUALITY_FACTOR,
+    BatchEntry, DowntimeEntry, ShiftKey, compute_shift_record, validate_shift_totals,
+)
+
+KEY = ShiftKey(datetime.date(2024, 5, 1), "M1", "Day")
+
+
+def test_compute_shift_record_rows_and_totals():
+    record = compute_shift_record(
+        KEY,
+        [DowntimeEntry("Cleaning", 1.0, "line wash"), DowntimeEntry("Breakdown", 0)],
+        [BatchEntry("P1", "B1", 600, 3.0), BatchEntry("P2", "B2", 400, 4.0)],
+        "12h", 10.0, {"P1": 100, "P2": 200},
+    )
+
+    # Zero-hour downtime is skipped; downtime rows come before production rows
+    assert [row["Activity"] for row in record.archive_rows] == ["Cleaning", "Production", "Production"]
+    assert record.archive_rows[0]["comments"] == "line wash"
+    p1, p2 = record.archive_rows[1:]
+    assert (p1["rate"], p1["standard rate"], p1["efficiency"]) == (200, 100, 2)
+    assert (p2["rate"], p2["standard rate"], p2["efficiency"]) == (100, 200, 0.5)
+
+    assert record.total_production_time == 7.0
+    assert record.total_downtime == 1.0
+    assert record.total_recorded_time == 8.0
+    assert record.average_efficiency == pytest.approx(1.25)
+    assert record.availability == pytest.approx(0.7)
+    assert record.oee == pytest.approx(QUALITY_FACTOR * 0.7 * 1.25)
+    assert record.av_row == {
+        "date": KEY.date, "machine": "M1", "shift type": "12h", "hours": 10.0, "shift": "Day",
+        "T.production time": 7.0, "Availability": record.availability,
+        "Av Efficiency": record.average_efficiency, "OEE": record.oee,
+    }
+
+
+def test_compute_shift_record_missing_rate_and_zero_time():
+    record = compute_shift_record(KEY, [], [BatchEntry("Unrated", "B1", 50, 0)], "12h", 10.0, {"Unrated": None})
+    row = record.archive_rows[0]
+    assert (row["rate"], row["standard rate"], row["efficiency"]) == (0, 1, 0)
+
+
+def test_compute_shift_record_partial_uses_recorded_time():
+    record = compute_shift_record(
+        KEY, [DowntimeEntry("Setup", 1.0)], [BatchEntry("P1", "B1", 300, 3.0)], PARTIAL_SHIFT_CODE, None, {"P1": 100},
+    )
+    assert record.availability == pytest.approx(0.75)
+
+
+def test_compute_shift_record_unknown_shift_and_empty_input():
+    record = compute_shift_record(KEY, [], [], "unknown", None, {})
+    assert record.archive_rows == []
+    assert (record.availability, record.average_efficiency, record.oee) == (0, 0, 0)
+
+
+@pytest.mark.parametrize("args, message", [
+    (("12h", 10.0, 1.2, 10.0), "Efficiency must not exceed 1"),
+    ((PARTIAL_SHIFT_CODE, PARTIAL_SHIFT_MAX_HOURS + 0.5, 0.9, None), "exceeds 7 hrs for a partial shift"),
+    (("12h", 10.0, 0.9, None), "not found in shifts.csv"),
+    (("12h", 10.5, 0.9, 10.0), "exceeds shift standard time"),
+    (("12h", 8.9, 0.9, 10.0), "less than 90%"),
+])
+def test_validate_shift_totals_rejects(args, message):
+    assert message in validate_shift_totals(*args)
+
+
+@pytest.mark.parametrize("args", [
+    ("12h", 10.0, 1.0, 10.0),
+    ("12h", 9.0, None, 10.0),
+    (PARTIAL_SHIFT_CODE, PARTIAL_SHIFT_MAX_HOURS, 0.5, None),
+])
+def test_validate_shift_totals_accepts(args):
+    assert validate_shift_totals(*args) is None